@@ -1853,7 +1853,7 @@ def read_geqdsk(
 <<<<<<< HEAD
     Inputs
     ------
-    filehandle   A file handle to read
+    filehandle   A file handle to read, or a read-only mmap.mmap of the file
     settings     dict passed to TokamakEquilibrium
     nonorthogonal_settings  dict passed to TokamakEquilibrium
 
@@ -1864,8 +1864,8 @@ def read_geqdsk(
 =======
     Parameters
     ----------
-    filehandle : file handle
-        A file handle to read
+    filehandle : file handle or mmap.mmap
+        A file handle to read, or a read-only mmap.mmap of the file
     settings : dict
         dict passed to TokamakEquilibrium
     nonorthogonal_settings : dict
@@ -1935,7 +1935,11 @@ def read_geqdsk(
     # reset to beginning of file
     filehandle.seek(0)
     # read file as a single string and store in result
-    result.geqdsk_input = filehandle.read()
+    geqdsk_input = filehandle.read()
+    if isinstance(geqdsk_input, bytes):
+        # filehandle was a memory-mapped file
+        geqdsk_input = geqdsk_input.decode()
+    result.geqdsk_input = geqdsk_input
     # also save filename, if it exists
     if hasattr(filehandle, "name"):
         result.geqdsk_filename = filehandle.name
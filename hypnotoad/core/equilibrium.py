@@ -25,7 +25,7 @@ the potential.
 from collections import OrderedDict
 from collections.abc import Sequence
 <<<<<<< HEAD
-from copy import deepcopy
+from copy import copy, deepcopy
 =======
 from copy import copy, deepcopy
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
@@ -40,6 +40,7 @@ from optionsfactory.checks import (
     is_non_negative_or_None,
 )
 import warnings
+import weakref
 
 import numpy
 from scipy.optimize import minimize_scalar, brentq
@@ -49,6 +50,12 @@ from scipy.special import erf, sici
 
 from .multilocationarray import MultiLocationArray
 
+# Axes created by Equilibrium.plotPotential() when no axis is passed, keyed by their
+# Figure so that repeated calls drawing into the same Figure can clear and re-use the
+# Axes instead of paying for the layout of a new one. Weak references are used so that
+# closed Figures can still be garbage collected.
+_potential_axes = weakref.WeakKeyDictionary()
+
 
 class SolutionError(Exception):
     """
@@ -97,6 +104,10 @@ class Point2D:
     Can be added, subtracted, multiplied by scalar
     """
 
+    # Contours and meshes hold very many Point2D objects, so avoid a per-instance
+    # __dict__
+    __slots__ = ("R", "Z")
+
     def __init__(self, R, Z):
         self.R = R
         self.Z = Z
@@ -118,23 +129,12 @@ class Point2D:
 
     def __iter__(self):
         """
-        Along with __next__() allows Point2D class to be treated like a tuple, e.g.
+        Allows Point2D class to be treated like a tuple, e.g.
         p = Point2D(1., 0.)
         val = f(*p)
         where f is a function that takes two arguments
         """
-        self.iterStep = 0
-        return self
-
-    def __next__(self):
-        if self.iterStep == 0:
-            self.iterStep = 1
-            return self.R
-        elif self.iterStep == 1:
-            self.iterStep = 2
-            return self.Z
-        else:
-            raise StopIteration
+        return iter((self.R, self.Z))
 
     def __repr__(self):
         """
@@ -895,24 +895,22 @@ class FineContour:
 
         # Define inner method so we can pass to func_timeout.func_timeout
         def refine(self, *, skip_endpoints=False):
-            result = numpy.zeros(self.positions.shape)
-
-            p = self.positions[0, :]
-            tangent = self.positions[1, :] - self.positions[0, :]
-            result[0, :] = self.parentContour.refinePoint(
-                Point2D(*p), Point2D(*tangent), psi=psi
-            ).as_ndarray()
-            for i in range(1, self.positions.shape[0] - 1):
-                p = self.positions[i, :]
-                tangent = self.positions[i + 1, :] - self.positions[i - 1, :]
-                result[i, :] = self.parentContour.refinePoint(
-                    Point2D(*p), Point2D(*tangent), psi=psi
-                ).as_ndarray()
-            p = self.positions[-1, :]
-            tangent = self.positions[-1, :] - self.positions[-2, :]
-            result[-1, :] = self.parentContour.refinePoint(
-                Point2D(*p), Point2D(*tangent), psi=psi
-            ).as_ndarray()
+            positions = self.positions
+            tangents = numpy.empty(positions.shape)
+            tangents[0, :] = positions[1, :] - positions[0, :]
+            tangents[1:-1, :] = positions[2:, :] - positions[:-2, :]
+            tangents[-1, :] = positions[-1, :] - positions[-2, :]
+
+            result = numpy.array(
+                [
+                    p.as_ndarray()
+                    for p in self.parentContour.refinePoints(
+                        [Point2D(*p) for p in positions],
+                        [Point2D(*t) for t in tangents],
+                        psi=psi,
+                    )
+                ]
+            )
 
             if skip_endpoints:
                 result[self.startInd] = self.positions[self.startInd]
@@ -1272,6 +1270,13 @@ class PsiContour:
     def __len__(self):
         return self.points.__len__()
 
+    def as_ndarray(self):
+        """
+        Positions of the points as an array of shape (len(self), 2), where [:, 0] is R
+        and [:, 1] is Z
+        """
+        return numpy.array([(p.R, p.Z) for p in self.points], dtype=float)
+
     def setSelfToContour(self, contour):
         """
         Copy the state of this object from contour
@@ -1493,30 +1498,6 @@ class PsiContour:
                 pass
             w /= 2.0
             if w < atol:
-                if False:
-                    print("width =", width)
-                    print("p = ", p)
-                    print("psi = {}, psival = {}".format(psi(*p), self.psival))
-                    print("Range: {} -> {}".format(f(*pline(0.0)), f(*pline(1.0))))
-
-                    pline0 = perpLine(width)
-                    Rbox = numpy.linspace(p.R - 0.1, p.R + 0.1, 100)[numpy.newaxis, :]
-                    Zbox = numpy.linspace(p.Z - 0.1, p.Z + 0.1, 100)[:, numpy.newaxis]
-                    svals = numpy.linspace(0.0, 1.0, 40)
-
-                    from matplotlib import pyplot
-
-                    pyplot.figure()
-                    self.plot("+")
-                    pyplot.contour(
-                        Rbox + 0.0 * Zbox, Zbox + 0.0 * Rbox, psi(Rbox, Zbox), 200
-                    )
-                    pyplot.plot(
-                        [pline0(s).R for s in svals], [pline0(s).Z for s in svals], "x"
-                    )
-                    pyplot.figure()
-                    pyplot.plot([f(*pline0(s)) for s in svals])
-                    pyplot.show()
                 raise SolutionError(
                     "Could not find interval to refine point at " + str(p)
                 )
@@ -1588,13 +1569,23 @@ class PsiContour:
 
         """
 
+        return self.refinePoints(
+            [p], [tangent], psi=psi, width=width, atol=atol, methods=methods
+        )[0]
+
+    def refinePoints(
+        self, points, tangents, *, psi, width=None, atol=None, methods=None, **kwargs
+    ):
+        """Refine each of points, moving along the corresponding vector in tangents.
+
+        Equivalent to calling refinePoint() for each point, but the options and the
+        refinement methods are only set up once. Returns a list of Point2D.
+        """
+
         if self.psival is None:
             # Can't refine
-            return p
+            return list(points)
 
-        # Available methods. Note: Currently this selection
-        # is done for every point. This would be better done once
-        # during __init__ and then re-used.
         available_methods = {
             "newton": self.refinePointNewton,
             "line": self.refinePointLinesearch,
@@ -1630,19 +1621,24 @@ class PsiContour:
         if isinstance(methods, str):
             methods = [methods]
 
-        for method in methods:
-            try:
-                # Try each method
-                return available_methods[method](
-                    p, tangent, psi=psi, width=width, atol=atol
-                )
-            except SolutionError:
-                # If it fails, try the next one
-                pass
+        method_functions = [available_methods[method] for method in methods]
+
+        def refine_one(p, tangent):
+            for method_function in method_functions:
+                try:
+                    # Try each method
+                    return method_function(p, tangent, psi=psi, width=width, atol=atol)
+                except SolutionError:
+                    # If it fails, try the next one
+                    pass
+
+            # All methods failed. If the user wants to continue anyway,
+            # the last method in the methods list can be set to "none"
+            raise SolutionError(
+                f"refinePoint failed to converge with methods: {methods}"
+            )
 
-        # All methods failed. If the user wants to continue anyway,
-        # the last method in the methods list can be set to "none"
-        raise SolutionError(f"refinePoint failed to converge with methods: {methods}")
+        return [refine_one(p, tangent) for p, tangent in zip(points, tangents)]
 
     def getRefined(self, skip_endpoints=False, *, width=None, atol=None, **kwargs):
         if width is None:
@@ -1650,35 +1646,14 @@ class PsiContour:
         if atol is None:
             atol = self.user_options.refine_atol
 
-        newpoints = []
-        newpoints.append(
-            self.refinePoint(
-                self.points[0],
-                self.points[1] - self.points[0],
-                width=width,
-                atol=atol,
-                **kwargs,
-            )
+        points = self.points
+        tangents = (
+            [points[1] - points[0]]
+            + [points[i + 1] - points[i - 1] for i in range(1, len(points) - 1)]
+            + [points[-1] - points[-2]]
         )
-        for i, p in enumerate(self.points[1:-1]):
-            # note i+1 here is the index of point p
-            newpoints.append(
-                self.refinePoint(
-                    p,
-                    self.points[i + 2] - self.points[i],
-                    width=width,
-                    atol=atol,
-                    **kwargs,
-                )
-            )
-        newpoints.append(
-            self.refinePoint(
-                self.points[-1],
-                self.points[-1] - self.points[-2],
-                width=width,
-                atol=atol,
-                **kwargs,
-            )
+        newpoints = self.refinePoints(
+            points, tangents, width=width, atol=atol, **kwargs
         )
 
         if skip_endpoints:
@@ -2732,30 +2707,21 @@ class EquilibriumRegion(PsiContour):
         }
 
     def copy(self):
-        result = EquilibriumRegion(
-            equilibrium=self.equilibrium,
-            name=self.name,
-            nSegments=self.nSegments,
-            nx=self.nx,
-            ny=self.ny_noguards,
-            kind=self.kind,
-            ny_total=self.ny_total,
-            points=deepcopy(self.points),
-            psival=self.psival,
-            Rrange=self.Rrange,
-            Zrange=self.Zrange,
-        )
+        # Shallow copy shares the read-only members (equilibrium, options, ranges)
+        # without re-creating the options objects. Only the mutable members are copied.
+        result = copy(self)
+        result.points = deepcopy(self.points)
         result.xPointsAtStart = deepcopy(self.xPointsAtStart)
         result.xPointsAtEnd = deepcopy(self.xPointsAtEnd)
         result.wallSurfaceAtStart = deepcopy(self.wallSurfaceAtStart)
         result.wallSurfaceAtEnd = deepcopy(self.wallSurfaceAtEnd)
         result.connections = deepcopy(self.connections)
         result.psi_vals = deepcopy(self.psi_vals)
-        result.separatrix_radial_index = self.separatrix_radial_index
-        result.startInd = self.startInd
-        result.endInd = self.endInd
-        result.extend_lower = self.extend_lower
-        result.extend_upper = self.extend_upper
+        # FineContour is modified in place, so the copy creates its own when needed
+        result._reset_cached()
+        result.global_xind = 0
+        result.sin_angle_at_start = None
+        result.sin_angle_at_end = None
         return result
 
     def newRegionFromPsiContour(self, contour):
@@ -4337,17 +4303,39 @@ class Equilibrium:
                         )
                 result = MultiLocationArray(args[0].nx, args[0].ny)
 
-                if all(arg.centre is not None for arg in args):
-                    result.centre = getResult(self, *(arg.centre for arg in args))
-
-                if all(arg.xlow is not None for arg in args):
-                    result.xlow = getResult(self, *(arg.xlow for arg in args))
+                # getResult acts element-by-element, so evaluate all the locations
+                # with a single call on the concatenated, flattened arrays
+                locations = ("centre", "xlow", "ylow", "corners")
+                arrays = [
+                    [getattr(arg, location) for location in locations] for arg in args
+                ]
+                flat_result = getResult(
+                    self,
+                    *(
+                        numpy.concatenate([a.ravel() for a in arg_arrays])
+                        for arg_arrays in arrays
+                    ),
+                )
 
-                if all(arg.ylow is not None for arg in args):
-                    result.ylow = getResult(self, *(arg.ylow for arg in args))
+                if flat_result is not None:
+                    # getResult may return a scalar, e.g. for a constant function
+                    flat_result = numpy.broadcast_to(
+                        flat_result, (sum(a.size for a in arrays[0]),)
+                    )
 
-                if all(arg.corners is not None for arg in args):
-                    result.corners = getResult(self, *(arg.corners for arg in args))
+                offset = 0
+                for location, array in zip(locations, arrays[0]):
+                    if flat_result is None:
+                        setattr(result, location, None)
+                    else:
+                        setattr(
+                            result,
+                            location,
+                            flat_result[offset : offset + array.size].reshape(
+                                array.shape
+                            ),
+                        )
+                    offset += array.size
             else:
                 result = getResult(self, *args)
             return result
@@ -4375,6 +4363,33 @@ class Equilibrium:
             # https://stackoverflow.com/questions/972/adding-a-method-to-an-existing-object-instance#comment66379065_2982
             self.psi = psi.__get__(self)
 
+            # Precompute the splines for the first derivatives of psi, which are
+            # evaluated for every step of the ODE solve in followPerpendicular, so that
+            # the coefficients of the derivatives are not recalculated on every call.
+            # RectBivariateSpline.partial_derivative() needs scipy>=1.9.
+            if hasattr(self.psi_func, "partial_derivative"):
+                dpsidR_func = self.psi_func.partial_derivative(1, 0)
+                dpsidZ_func = self.psi_func.partial_derivative(0, 1)
+            else:
+                dpsidR_func = functools.partial(self.psi_func, dx=1)
+                dpsidZ_func = functools.partial(self.psi_func, dy=1)
+
+            # f_R and f_Z are called one after the other at the same point for every
+            # step of the ODE solve in followPerpendicular, so keep the gradient of psi
+            # from the last scalar (R, Z) to halve the number of spline evaluations
+            last_grad_psi = (None, None, None, None)
+
+            def grad_psi(R, Z):
+                nonlocal last_grad_psi
+                scalar = numpy.ndim(R) == 0 and numpy.ndim(Z) == 0
+                if scalar and last_grad_psi[:2] == (R, Z):
+                    return last_grad_psi[2:]
+                dpsidR = dpsidR_func(R, Z, grid=False)
+                dpsidZ = dpsidZ_func(R, Z, grid=False)
+                if scalar:
+                    last_grad_psi = (R, Z, dpsidR, dpsidZ)
+                return dpsidR, dpsidZ
+
             @Equilibrium.handleMultiLocationArray
             def f_R(self, R, Z):
                 """returns the R component of the vector Grad(psi)/|Grad(psi)|**2."""
@@ -4383,8 +4398,7 @@ class Equilibrium:
                 R = numpy.clip(R, Rmin, Rmax)
                 Z = numpy.clip(Z, Zmin, Zmax)
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-                dpsidR = self.psi_func(R, Z, dx=1, grid=False)
-                dpsidZ = self.psi_func(R, Z, dy=1, grid=False)
+                dpsidR, dpsidZ = grad_psi(R, Z)
                 return dpsidR / (dpsidR**2 + dpsidZ**2)
 
             self.f_R = f_R.__get__(self)
@@ -4397,8 +4411,7 @@ class Equilibrium:
                 R = numpy.clip(R, Rmin, Rmax)
                 Z = numpy.clip(Z, Zmin, Zmax)
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-                dpsidR = self.psi_func(R, Z, dx=1, grid=False)
-                dpsidZ = self.psi_func(R, Z, dy=1, grid=False)
+                dpsidR, dpsidZ = grad_psi(R, Z)
                 return dpsidZ / (dpsidR**2 + dpsidZ**2)
 
             self.f_Z = f_Z.__get__(self)
@@ -4406,14 +4419,14 @@ class Equilibrium:
             @Equilibrium.handleMultiLocationArray
             def Bp_R(self, R, Z):
                 """returns the R component of the poloidal magnetic field."""
-                return self.psi_func(R, Z, dy=1, grid=False) / R
+                return dpsidZ_func(R, Z, grid=False) / R
 
             self.Bp_R = Bp_R.__get__(self)
 
             @Equilibrium.handleMultiLocationArray
             def Bp_Z(self, R, Z):
                 """returns the Z component of the poloidal magnetic field."""
-                return -self.psi_func(R, Z, dx=1, grid=False) / R
+                return -dpsidR_func(R, Z, grid=False) / R
 
             self.Bp_Z = Bp_Z.__get__(self)
 
@@ -4859,6 +4872,45 @@ class Equilibrium:
 
         return intersect
 
+    def segmentsMayIntersectWall(self, positions):
+        """
+        Vectorised, conservative check for which of the line segments joining consecutive
+        points in positions (an array with shape (N, 2)) might intersect the wall.
+
+        Returns a boolean array of length N - 1. Segments where the result is False do
+        not intersect the wall, so wallIntersection() only needs to be called for the
+        segments where it is True.
+        """
+        # Tolerance for the distance of a point from a line. Much larger than
+        # intersect_tolerance so that no intersection that would be found by
+        # wallIntersection() is excluded.
+        tol = 1.0e-9
+
+        p1 = positions[:-1, numpy.newaxis, :]
+        p2 = positions[1:, numpy.newaxis, :]
+        w1 = self.closed_wallarray[numpy.newaxis, :-1, :]
+        w2 = self.closed_wallarray[numpy.newaxis, 1:, :]
+
+        def straddles(a, b, c, d):
+            # Signed distances of c and d from the line through a and b. Segment c-d
+            # can only touch the line if they are not both on the same side.
+            ab = b - a
+            length = numpy.hypot(ab[..., 0], ab[..., 1])
+            ac = c - a
+            ad = d - a
+            dist_c = (ab[..., 0] * ac[..., 1] - ab[..., 1] * ac[..., 0]) / length
+            dist_d = (ab[..., 0] * ad[..., 1] - ab[..., 1] * ad[..., 0]) / length
+            # Written so that NaNs from zero-length segments count as candidates
+            return ~(
+                (numpy.minimum(dist_c, dist_d) > tol)
+                | (numpy.maximum(dist_c, dist_d) < -tol)
+            )
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            may_intersect = straddles(p1, p2, w1, w2) & straddles(w1, w2, p1, p2)
+
+        return numpy.any(may_intersect, axis=1)
+
     def make1dGrid(self, n, spacingFunc):
         """
         Make a 1d grid:
@@ -5349,6 +5401,7 @@ class Equilibrium:
         ncontours=40,
         labels=True,
         axis=None,
+        fig=None,
         **kwargs,
     ):
         from matplotlib import pyplot
@@ -5366,7 +5419,17 @@ class Equilibrium:
         Z = numpy.linspace(Zmin, Zmax, npoints)
 
         if axis is None:
-            axis = pyplot.axes(aspect="equal")
+            if fig is None:
+                fig = pyplot.gcf()
+            axis_ref = _potential_axes.get(fig)
+            axis = axis_ref() if axis_ref is not None else None
+            if axis is not None and axis in fig.axes:
+                axis.cla()
+                axis.set_aspect("equal")
+                fig.sca(axis)
+            else:
+                axis = fig.add_subplot(aspect="equal")
+                _potential_axes[fig] = weakref.ref(axis)
 
         contours = axis.contour(
             R,
@@ -5376,10 +5439,51 @@ class Equilibrium:
             **kwargs,
         )
         if labels:
-            pyplot.clabel(contours, inline=False, fmt="%1.3g")
+            axis.clabel(contours, inline=False, fmt="%1.3g")
 
         return axis
 
+    def _scatterRegions(self, *, marker="x", **kwargs):
+        """
+        Scatter plot the points of all the EquilibriumRegions in `self.regions` using a
+        single call to `pyplot.scatter()`, colouring the points by region. Empty proxy
+        lines are added to the Axes so that `pyplot.legend()` still shows one entry for
+        each region.
+        """
+        from matplotlib import pyplot
+        from matplotlib.lines import Line2D
+
+        regions = list(self.regions.values())
+        if not regions:
+            return
+
+        R = numpy.concatenate([[p.R for p in region] for region in regions])
+        Z = numpy.concatenate([[p.Z for p in region] for region in regions])
+
+        color = kwargs.get("color", None)
+        if color is None and "c" not in kwargs:
+            region_colors = [f"C{i}" for i in range(len(regions))]
+            kwargs["c"] = numpy.repeat(
+                region_colors, [len(region) for region in regions]
+            )
+        else:
+            region_colors = [color] * len(regions)
+
+        pyplot.scatter(R, Z, marker=marker, label="_nolegend_", **kwargs)
+
+        axis = pyplot.gca()
+        for region, region_color in zip(regions, region_colors):
+            axis.add_line(
+                Line2D(
+                    [],
+                    [],
+                    linestyle="",
+                    marker=marker,
+                    color=region_color,
+                    label=region.name,
+                )
+            )
+
 <<<<<<< HEAD
     def plotWall(self, axis=None):
 =======
@@ -5404,12 +5508,7 @@ class Equilibrium:
             return axis
 
     def plotSeparatrix(self):
-        from matplotlib import pyplot
-
-        for region in self.regions.values():
-            R = [p.R for p in region]
-            Z = [p.Z for p in region]
-            pyplot.scatter(R, Z, marker="x", label=region.name)
+        self._scatterRegions(marker="x")
 =======
                 axis = pyplot.plot(
                     wall_R,
@@ -5487,12 +5586,12 @@ class Equilibrium:
             if "colors" in kwargs:
                 # Passing `colors` to `plot` or `scatter` causes an error
                 del kwargs["colors"]
-            for region in self.regions.values():
-                R = [p.R for p in region]
-                Z = [p.Z for p in region]
-                if scatter:
-                    pyplot.scatter(R, Z, marker=marker, label=region.name, **kwargs)
-                else:
+            if scatter:
+                self._scatterRegions(marker=marker, **kwargs)
+            else:
+                for region in self.regions.values():
+                    R = [p.R for p in region]
+                    Z = [p.Z for p in region]
                     pyplot.plot(R, Z, label=region.name, **kwargs)
 
     def plotHighlightRegion(
@@ -21,8 +21,13 @@
 Classes to handle Meshes and geometrical quantities for generating BOUT++ grids
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import lru_cache
+import hashlib
+from itertools import accumulate
 import re
+import subprocess
 import sys
 import warnings
 import yaml
@@ -34,7 +39,7 @@ from optionsfactory.checks import (
     is_non_negative,
     is_positive,
 )
-from scipy.integrate import cumulative_trapezoid, solve_ivp
+from scipy.integrate import solve_ivp
 from scipy.interpolate import interp1d
 
 from boututils.boutarray import BoutArray
@@ -142,6 +147,15 @@ class MeshRegion:
             value_type=[float, int],
             check_all=is_positive,
         ),
+        check_jacobian=WithMeta(
+            True,
+            doc=(
+                "Check that the Jacobian is consistent with the metric tensor (to "
+                "within geometry_rtol). The check can be switched off to save time "
+                "when generating grids from inputs that are known to be OK"
+            ),
+            value_type=bool,
+        ),
         cap_Bp_ylow_xpoint=WithMeta(
             False,
             doc=(
@@ -164,6 +178,10 @@ class MeshRegion:
         ),
     )
 
+    # Compiled expressions used by _eval_from_region(), keyed by (expr, region,
+    # component)
+    _expr_cache = {}
+
     def __init__(
         self,
         meshParent,
@@ -235,6 +253,12 @@ class MeshRegion:
         else:
             temp_psi_vals = self.psi_vals
 
+        # Look these up once, as they are used for every call to followPerpendicular
+        f_R = self.meshParent.equilibrium.f_R
+        f_Z = self.meshParent.equilibrium.f_Z
+        rtol = self.user_options.follow_perpendicular_rtol
+        atol = self.user_options.follow_perpendicular_atol
+
         # Make vector along grad(psi) at start of equilibriumRegion Here we assume that
         # the equilibriumRegion at a separatrix at the beginning and end, but not
         # necessarily in between.  This is to handle disconnected double null
@@ -258,11 +282,11 @@ class MeshRegion:
             0,
             start_point,
             start_psi,
-            f_R=self.meshParent.equilibrium.f_R,
-            f_Z=self.meshParent.equilibrium.f_Z,
+            f_R=f_R,
+            f_Z=f_Z,
             psivals=[start_psi, start_psi_sep_plus_delta],
-            rtol=self.user_options.follow_perpendicular_rtol,
-            atol=self.user_options.follow_perpendicular_atol,
+            rtol=rtol,
+            atol=atol,
 <<<<<<< HEAD
 =======
             maxits=self.user_options.follow_perpendicular_maxits,
@@ -292,11 +316,11 @@ class MeshRegion:
             -1,
             end_point,
             end_psi,
-            f_R=self.meshParent.equilibrium.f_R,
-            f_Z=self.meshParent.equilibrium.f_Z,
+            f_R=f_R,
+            f_Z=f_Z,
             psivals=[end_psi, end_psi_sep_plus_delta],
-            rtol=self.user_options.follow_perpendicular_rtol,
-            atol=self.user_options.follow_perpendicular_atol,
+            rtol=rtol,
+            atol=atol,
 <<<<<<< HEAD
 =======
             maxits=self.user_options.follow_perpendicular_maxits,
@@ -314,43 +338,53 @@ class MeshRegion:
         fine_contour = self.equilibriumRegion.get_fine_contour(
             psi=self.equilibriumRegion.psi
         )
+        # Vectors along the separatrix and along grad(psi) at the lower (row 0) and upper
+        # (row 1) ends, normalised and dotted together in one go
+        unit_vec_separatrix = numpy.stack(
+            [
+                fine_contour.positions[fine_contour.startInd + 1, :]
+                - fine_contour.positions[fine_contour.startInd, :],
+                fine_contour.positions[fine_contour.endInd - 1, :]
+                - fine_contour.positions[fine_contour.endInd, :],
+            ]
+        )
+        unit_vec_separatrix /= numpy.linalg.norm(
+            unit_vec_separatrix, axis=1, keepdims=True
+        )
+        unit_vec_surface = numpy.stack(
+            [
+                self.equilibriumRegion.gradPsiSurfaceAtStart,
+                self.equilibriumRegion.gradPsiSurfaceAtEnd,
+            ]
+        )
+        unit_vec_surface /= numpy.linalg.norm(unit_vec_surface, axis=1, keepdims=True)
+        cos_angle = numpy.einsum("ij,ij->i", unit_vec_separatrix, unit_vec_surface)
+        # this gives abs(sin_angle), but that's OK because we only want the magnitude to
+        # calculate perp_d
+        sin_angle = numpy.sqrt(1.0 - cos_angle**2)
         if self.equilibriumRegion.wallSurfaceAtStart is None:
             # lower end
-            unit_vec_separatrix = (
-                fine_contour.positions[fine_contour.startInd + 1, :]
-                - fine_contour.positions[fine_contour.startInd, :]
-            )
-            unit_vec_separatrix /= numpy.sqrt(numpy.sum(unit_vec_separatrix**2))
-            unit_vec_surface = self.equilibriumRegion.gradPsiSurfaceAtStart
-            unit_vec_surface /= numpy.sqrt(numpy.sum(unit_vec_surface**2))
-            cos_angle = numpy.sum(unit_vec_separatrix * unit_vec_surface)
-            # this gives abs(sin_angle), but that's OK because we only want the magnitude
-            # to calculate perp_d
-            self.equilibriumRegion.sin_angle_at_start = numpy.sqrt(1.0 - cos_angle**2)
+            self.equilibriumRegion.sin_angle_at_start = sin_angle[0]
         if self.equilibriumRegion.wallSurfaceAtEnd is None:
             # upper end
-            unit_vec_separatrix = (
-                fine_contour.positions[fine_contour.endInd - 1, :]
-                - fine_contour.positions[fine_contour.endInd, :]
-            )
-            unit_vec_separatrix /= numpy.sqrt(numpy.sum(unit_vec_separatrix**2))
-            unit_vec_surface = self.equilibriumRegion.gradPsiSurfaceAtEnd
-            unit_vec_surface /= numpy.sqrt(numpy.sum(unit_vec_surface**2))
-            cos_angle = numpy.sum(unit_vec_separatrix * unit_vec_surface)
-            # this gives abs(sin_angle), but that's OK because we only want the magnitude
-            # to calculate perp_d
-            self.equilibriumRegion.sin_angle_at_end = numpy.sqrt(1.0 - cos_angle**2)
+            self.equilibriumRegion.sin_angle_at_end = sin_angle[1]
+
+        # Evaluate psi at all the start points at once
+        start_positions = self.equilibriumRegion.as_ndarray()
+        start_psis = self.equilibriumRegion.psi(
+            start_positions[:, 0], start_positions[:, 1]
+        )
 
         perp_points_list = self.parallel_map(
             followPerpendicular,
             zip(
                 range(len(self.equilibriumRegion)),
                 self.equilibriumRegion,
-                [self.equilibriumRegion.psi(*p) for p in self.equilibriumRegion],
+                start_psis,
             ),
             psivals=temp_psi_vals,
-            rtol=self.user_options.follow_perpendicular_rtol,
-            atol=self.user_options.follow_perpendicular_atol,
+            rtol=rtol,
+            atol=atol,
 <<<<<<< HEAD
 =======
             maxits=self.user_options.follow_perpendicular_maxits,
@@ -361,16 +395,15 @@ class MeshRegion:
             for perp_points in perp_points_list:
                 perp_points.reverse()
 
-        for i, point in enumerate(perp_points_list[0]):
+        # Transpose perp_points_list so that each contour is created from its complete
+        # list of points, rather than appending points one at a time
+        for i, points in enumerate(zip(*perp_points_list)):
             self.contours.append(
                 self.equilibriumRegion.newContourFromSelf(
-                    points=[point], psival=self.psi_vals[i]
+                    points=list(points), psival=self.psi_vals[i]
                 )
             )
             self.contours[i].global_xind = self.globalXInd(i)
-        for perp_points in perp_points_list[1:]:
-            for i, point in enumerate(perp_points):
-                self.contours[i].append(point)
 
         # refine the contours to make sure they are at exactly the right psi-value
         self.contours = self.parallel_map(
@@ -484,11 +517,10 @@ class MeshRegion:
                         psi=self.equilibriumRegion.psi
                     )
 
-                    return (
-                        lambda i: sfunc_orthogonal_original(i)
-                        - original_total_distance
-                        + new_total_distance
-                    )
+                    # Combine the two constants once, rather than on every call
+                    distance_offset = new_total_distance - original_total_distance
+
+                    return lambda i: sfunc_orthogonal_original(i) + distance_offset
 
                 # original sfuncs_orthogonal would put the points at the positions
                 # along the contour where the grid would be orthogonal need to
@@ -548,25 +580,26 @@ class MeshRegion:
         if nonorthogonal_settings is not None:
             self.equilibriumRegion.resetNonorthogonalOptions(nonorthogonal_settings)
 
+        # These do not change between contours, so look them up once
+        psi_sep = self.meshParent.equilibrium.psi_sep[0]
+        wallSurfaceAtStart = self.equilibriumRegion.wallSurfaceAtStart
+        wallSurfaceAtEnd = self.equilibriumRegion.wallSurfaceAtEnd
+        spacing_method = (
+            self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
+        )
+
         def surface_vec(i_contour, contour, lower):
-            psi_sep = self.meshParent.equilibrium.psi_sep[0]
             contour_is_separatrix = (
                 numpy.abs((contour.psival - psi_sep) / psi_sep) < 1.0e-9
             )
 
             if contour_is_separatrix:
+                # Use the wall surface if there is one, otherwise None to use poloidal
+                # spacing on a separatrix contour
                 if lower:
-                    if self.equilibriumRegion.wallSurfaceAtStart is not None:
-                        return self.equilibriumRegion.wallSurfaceAtStart
-                    else:
-                        # Use poloidal spacing on a separatrix contour
-                        return None
+                    return wallSurfaceAtStart
                 else:
-                    if self.equilibriumRegion.wallSurfaceAtEnd is not None:
-                        return self.equilibriumRegion.wallSurfaceAtEnd
-                    else:
-                        # Use poloidal spacing on a separatrix contour
-                        return None
+                    return wallSurfaceAtEnd
 
             if i_contour == 0:
                 c_in = self.contours[0]
@@ -591,22 +624,17 @@ class MeshRegion:
         #    surface_vec(i, c, False) for i, c in enumerate(self.contours)
         # ]
 
+        # Note: surface_vec() is only called for the spacing methods that use it, and
+        # must be called in the regridding loop (not before it) because it uses the
+        # already-regridded neighbouring contours
         def get_sfunc(i_contour, contour, sfunc_orthogonal):
-            surface_vec_lower = surface_vec(i_contour, contour, True)
-            surface_vec_upper = surface_vec(i_contour, contour, False)
-            if (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "orthogonal"
-            ):
+            if spacing_method == "orthogonal":
                 warnings.warn(
                     "'orthogonal' option is not currently compatible with "
                     "extending grid past targets"
                 )
                 return sfunc_orthogonal
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "fixed_poloidal"
-            ):
+            elif spacing_method == "fixed_poloidal":
                 # this sfunc gives a fixed poloidal spacing at beginning and end of
                 # contours
                 return self.equilibriumRegion.getSfuncFixedSpacing(
@@ -614,51 +642,42 @@ class MeshRegion:
                     contour.totalDistance(),
                     method="monotonic",
                 )
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "poloidal_orthogonal_combined"
-            ):
+            elif spacing_method == "poloidal_orthogonal_combined":
                 return self.equilibriumRegion.combineSfuncs(contour, sfunc_orthogonal)
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "fixed_perp_lower"
-            ):
+            elif spacing_method == "fixed_perp_lower":
                 return self.equilibriumRegion.getSfuncFixedPerpSpacing(
-                    2 * self.ny_noguards + 1, contour, surface_vec_lower, True
+                    2 * self.ny_noguards + 1,
+                    contour,
+                    surface_vec(i_contour, contour, True),
+                    True,
                 )
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "fixed_perp_upper"
-            ):
+            elif spacing_method == "fixed_perp_upper":
                 return self.equilibriumRegion.getSfuncFixedPerpSpacing(
-                    2 * self.ny_noguards + 1, contour, surface_vec_upper, False
+                    2 * self.ny_noguards + 1,
+                    contour,
+                    surface_vec(i_contour, contour, False),
+                    False,
                 )
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "perp_orthogonal_combined"
-            ):
+            elif spacing_method == "perp_orthogonal_combined":
                 return self.equilibriumRegion.combineSfuncs(
                     contour,
                     sfunc_orthogonal,
-                    surface_vec_lower,
-                    surface_vec_upper,
+                    surface_vec(i_contour, contour, True),
+                    surface_vec(i_contour, contour, False),
                 )
-            elif (
-                self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method
-                == "combined"
-            ):
-                if self.equilibriumRegion.wallSurfaceAtStart is not None:
+            elif spacing_method == "combined":
+                if wallSurfaceAtStart is not None:
                     # use poloidal spacing near a wall
                     surface_vec_lower = None
                 else:
                     # use perp spacing
-                    surface_vec_lower = surface_vec_lower
-                if self.equilibriumRegion.wallSurfaceAtEnd is not None:
+                    surface_vec_lower = surface_vec(i_contour, contour, True)
+                if wallSurfaceAtEnd is not None:
                     # use poloidal spacing near a wall
                     surface_vec_upper = None
                 else:
                     # use perp spacing
-                    surface_vec_upper = surface_vec_upper
+                    surface_vec_upper = surface_vec(i_contour, contour, False)
                 return self.equilibriumRegion.combineSfuncs(
                     contour,
                     sfunc_orthogonal,
@@ -668,9 +687,7 @@ class MeshRegion:
             else:
                 raise ValueError(
                     "Unrecognized option '"
-                    + str(
-                        self.equilibriumRegion.nonorthogonal_options.nonorthogonal_spacing_method  # noqa: E501
-                    )
+                    + str(spacing_method)
                     + "' for nonorthogonal poloidal spacing function"
                 )
 
@@ -685,7 +702,8 @@ class MeshRegion:
         for i, c, sfunc_orth in zip(
             range(len(self.contours)), self.contours, self.sfunc_orthogonal_list
         ):
-            print("Regridding:", i, flush=True, end="\r")
+            if _print_progress(i, len(self.contours)):
+                print("Regridding:", i, flush=True, end="\r")
             c.regrid(
                 2 * self.ny_noguards + 1,
                 psi=self.equilibriumRegion.psi,
@@ -735,36 +753,22 @@ class MeshRegion:
         self.Rxy = MultiLocationArray(self.nx, self.ny)
         self.Zxy = MultiLocationArray(self.nx, self.ny)
 
-        self.Rxy.centre = numpy.array(
-            [[p.R for p in contour[1::2]] for contour in self.contours[1::2]]
-        )
-
-        self.Rxy.ylow = numpy.array(
-            [[p.R for p in contour[0::2]] for contour in self.contours[1::2]]
+        # positions has shape (2*nx+1, 2*ny+1, 2), with R in [..., 0] and Z in
+        # [..., 1]. Cell centres are at odd indices, and lower faces/corners at even
+        # indices, in each direction.
+        positions = numpy.stack(
+            [contour.as_ndarray() for contour in self.contours], axis=0
         )
 
-        self.Rxy.xlow = numpy.array(
-            [[p.R for p in contour[1::2]] for contour in self.contours[0::2]]
-        )
-
-        self.Zxy.centre = numpy.array(
-            [[p.Z for p in contour[1::2]] for contour in self.contours[1::2]]
-        )
-
-        self.Zxy.ylow = numpy.array(
-            [[p.Z for p in contour[0::2]] for contour in self.contours[1::2]]
-        )
+        self.Rxy.centre = positions[1::2, 1::2, 0]
+        self.Rxy.ylow = positions[1::2, 0::2, 0]
+        self.Rxy.xlow = positions[0::2, 1::2, 0]
+        self.Rxy.corners = positions[0::2, 0::2, 0]
 
-        self.Zxy.xlow = numpy.array(
-            [[p.Z for p in contour[1::2]] for contour in self.contours[0::2]]
-        )
-
-        self.Rxy.corners = numpy.array(
-            [[p.R for p in contour[0::2]] for contour in self.contours[0::2]]
-        )
-        self.Zxy.corners = numpy.array(
-            [[p.Z for p in contour[0::2]] for contour in self.contours[0::2]]
-        )
+        self.Zxy.centre = positions[1::2, 1::2, 1]
+        self.Zxy.ylow = positions[1::2, 0::2, 1]
+        self.Zxy.xlow = positions[0::2, 1::2, 1]
+        self.Zxy.corners = positions[0::2, 0::2, 1]
 
         # Fix up the corner values at the X-points. Because the PsiContour have to start
         # slightly away from the X-point in order for the integrator to go in the right
@@ -857,10 +861,9 @@ class MeshRegion:
         # all regions have filled their Rxy and Zxy arrays.
         if self.connections["upper"] is not None:
             up = self.getNeighbour("upper")
-            self.Rxy.ylow[:, -1] = up.Rxy.ylow[:, 0]
-            self.Zxy.ylow[:, -1] = up.Zxy.ylow[:, 0]
-            self.Rxy.corners[:, -1] = up.Rxy.corners[:, 0]
-            self.Zxy.corners[:, -1] = up.Zxy.corners[:, 0]
+            for this, other in ((self.Rxy, up.Rxy), (self.Zxy, up.Zxy)):
+                this.ylow[:, -1] = other.ylow[:, 0]
+                this.corners[:, -1] = other.corners[:, 0]
 
     def calcDistances(self):
         """
@@ -878,9 +881,11 @@ class MeshRegion:
         """
         self.psixy = self.meshParent.equilibrium.psi(self.Rxy, self.Zxy)
 
+        # dx only depends on x, so is broadcast along y when it is stored
+        dx = (self.psi_vals[2::2] - self.psi_vals[:-2:2])[:, numpy.newaxis]
         self.dx = MultiLocationArray(self.nx, self.ny)
-        self.dx.centre = (self.psi_vals[2::2] - self.psi_vals[:-2:2])[:, numpy.newaxis]
-        self.dx.ylow = (self.psi_vals[2::2] - self.psi_vals[:-2:2])[:, numpy.newaxis]
+        self.dx.centre = dx
+        self.dx.ylow = dx
 
         if self.psi_vals[0] > self.psi_vals[-1]:
             # x-coordinate is -psixy so x always increases radially across grid
@@ -890,15 +895,11 @@ class MeshRegion:
             self.bpsign = 1.0
             self.xcoord = self.psixy
 
-        self.dy = MultiLocationArray(self.nx, self.ny)
-        self.dy.centre = self.meshParent.dy_scalar
-        self.dy.ylow = self.meshParent.dy_scalar
-        self.dy.xlow = self.meshParent.dy_scalar
-        self.dy.corners = self.meshParent.dy_scalar
+        self.dy = MultiLocationArray(self.nx, self.ny).fill(self.meshParent.dy_scalar)
 
         self.Brxy = self.meshParent.equilibrium.Bp_R(self.Rxy, self.Zxy)
         self.Bzxy = self.meshParent.equilibrium.Bp_Z(self.Rxy, self.Zxy)
-        self.Bpxy = numpy.sqrt(self.Brxy**2 + self.Bzxy**2)
+        self.Bpxy = numpy.hypot(self.Brxy, self.Bzxy)
 
         self.calcPoloidalDistance()
 
@@ -927,7 +928,7 @@ class MeshRegion:
             print(
                 "Poloidal field is in opposite direction to Grad(theta) -> Bp negative"
             )
-            self.Bpxy = -self.Bpxy
+            numpy.negative(self.Bpxy, out=self.Bpxy)
             if self.bpsign > 0.0:
                 raise ValueError(
                     "Sign of Bp should be negative? (note this check will raise an "
@@ -945,7 +946,7 @@ class MeshRegion:
         # Get toroidal field from poloidal current function fpol
         self.Btxy = self.meshParent.equilibrium.fpol(self.psixy) / self.Rxy
 
-        self.Bxy = numpy.sqrt(self.Bpxy**2 + self.Btxy**2)
+        self.Bxy = numpy.hypot(self.Bpxy, self.Btxy)
 
     def geometry2(self):
         """
@@ -965,9 +966,6 @@ class MeshRegion:
             # Calculate beta (angle between e_x and Grad(x), also the angle between e_y
             # and Grad(y)), used for non-orthogonal grid
             self.calcBeta()
-        # else:
-        #    self.beta.centre = 0.
-        #    self.eta.centre = 0.
 
         # variation of toroidal angle with y following a field line. Called 'pitch' in
         # Hypnotoad1 because if y was the poloidal angle then dphidy would be the pitch
@@ -1061,76 +1059,91 @@ class MeshRegion:
         # ShiftTorsion is only used in Curl operator - Curl is rarely used.
         self.ShiftTorsion = self.DDX("#dphidy")
 
+        # Common factors, calculated once to avoid creating the same temporary
+        # MultiLocationArrays several times
+        Rxy2 = self.Rxy**2
+
+        inv_hy = 1.0 / self.hy
+
         if self.user_options.orthogonal:
+            hy2 = self.hy**2
+            dphidy_over_hy = self.dphidy * inv_hy
+
             self.g11 = (self.Rxy * self.Bpxy) ** 2
-            self.g22 = 1.0 / self.hy**2
-            self.g33 = (
-                self.I * self.g11 + (self.dphidy / self.hy) ** 2 + 1.0 / self.Rxy**2
-            )
+            I_g11 = self.I * self.g11
+            self.g22 = inv_hy * inv_hy
+            # Sums of several terms are accumulated in-place, to avoid creating a
+            # temporary MultiLocationArray for each partial sum
+            self.g33 = I_g11 + dphidy_over_hy * dphidy_over_hy
+            self.g33 += 1.0 / Rxy2
             self.g12 = MultiLocationArray(self.nx, self.ny).zero()
-            self.g13 = -self.I * self.g11
-            self.g23 = -self.dphidy / self.hy**2
+            self.g13 = -I_g11
+            self.g23 = -dphidy_over_hy * inv_hy
 
             self.J = self.hy / self.Bpxy
 
-            self.g_11 = 1.0 / self.g11 + (self.I * self.Rxy) ** 2
-            self.g_22 = self.hy**2 + (self.Rxy * self.dphidy) ** 2
-            self.g_33 = self.Rxy**2
-            self.g_12 = self.Rxy**2 * self.dphidy * self.I
-            self.g_13 = self.Rxy**2 * self.I
-            self.g_23 = self.dphidy * self.Rxy**2
+            self.g_11 = 1.0 / self.g11
+            self.g_11 += (self.I * self.Rxy) ** 2
+            self.g_22 = (self.Rxy * self.dphidy) ** 2
+            self.g_22 += hy2
+            self.g_33 = Rxy2
+            self.g_12 = Rxy2 * self.dphidy * self.I
+            self.g_13 = Rxy2 * self.I
+            self.g_23 = self.dphidy * Rxy2
         else:
-            self.g11 = (self.Rxy * self.Bpxy) ** 2
+            RBp = self.Rxy * self.Bpxy
+            R_absBp = self.Rxy * numpy.abs(self.Bpxy)
+            tanBeta_over_hy = self.tanBeta * inv_hy
+
+            self.g11 = RBp**2
             self.g22 = 1.0 / (self.hy * self.cosBeta) ** 2
-            self.g33 = (
-                1.0 / self.Rxy**2
-                + (self.Rxy * self.Bpxy * self.I) ** 2
-                + (self.dphidy / (self.hy * self.cosBeta)) ** 2
-                + 2.0
-                * self.Rxy
-                * self.Bpxy
-                * self.I
-                * self.dphidy
-                * self.tanBeta
-                / self.hy
-            )
-            self.g12 = self.Rxy * numpy.abs(self.Bpxy) * self.tanBeta / self.hy
-            self.g13 = (
-                -self.Rxy * self.Bpxy * self.dphidy * self.tanBeta / self.hy
-                - self.I * (self.Rxy * self.Bpxy) ** 2
-            )
-            self.g23 = (
-                -self.bpsign * self.dphidy / (self.hy * self.cosBeta) ** 2
-                - self.Rxy * numpy.abs(self.Bpxy) * self.I * self.tanBeta / self.hy
-            )
+            # Sums of several terms are accumulated in-place, to avoid creating a
+            # temporary MultiLocationArray for each partial sum. Locations that are
+            # not set in every term (e.g. xlow and corners of g33, as g22 is only set
+            # at centre and ylow) are unset by the in-place operations, as they would
+            # be in the out-of-place result
+            self.g33 = 1.0 / Rxy2
+            self.g33 += (RBp * self.I) ** 2
+            self.g33 += self.dphidy**2 * self.g22
+            self.g33 += 2.0 * RBp * self.I * self.dphidy * tanBeta_over_hy
+            self.g12 = R_absBp * tanBeta_over_hy
+            self.g13 = -RBp * self.dphidy * tanBeta_over_hy
+            self.g13 -= self.I * self.g11
+            self.g23 = -self.bpsign * self.dphidy * self.g22
+            self.g23 -= R_absBp * self.I * tanBeta_over_hy
 
             self.J = self.hy / self.Bpxy
 
-            self.g_11 = (
-                1.0 / (self.Rxy * self.Bpxy * self.cosBeta) ** 2
-                + (self.I * self.Rxy) ** 2
-            )
-            self.g_22 = self.hy**2 + (self.dphidy * self.Rxy) ** 2
-            self.g_33 = self.Rxy**2
-            self.g_12 = (
-                self.bpsign * self.I * self.dphidy * self.Rxy**2
-                - self.hy * self.tanBeta / (self.Rxy * numpy.abs(self.Bpxy))
-            )
-            self.g_13 = self.I * self.Rxy**2
-            self.g_23 = self.bpsign * self.dphidy * self.Rxy**2
-
-        # check Jacobian is OK
-        Jcheck = (
-            self.bpsign
-            * 1.0
-            / numpy.sqrt(
-                self.g11 * self.g22 * self.g33
-                + 2.0 * self.g12 * self.g13 * self.g23
-                - self.g11 * self.g23**2
-                - self.g22 * self.g13**2
-                - self.g33 * self.g12**2
-            )
+            self.g_11 = 1.0 / (RBp * self.cosBeta) ** 2
+            self.g_11 += (self.I * self.Rxy) ** 2
+            self.g_22 = self.hy**2
+            self.g_22 += (self.dphidy * self.Rxy) ** 2
+            self.g_33 = Rxy2
+            self.g_12 = self.bpsign * self.I * self.dphidy * Rxy2
+            self.g_12 -= self.hy * self.tanBeta / R_absBp
+            self.g_13 = self.I * Rxy2
+            self.g_23 = self.bpsign * self.dphidy * Rxy2
+
+        if self.user_options.check_jacobian:
+            self.checkJacobian()
+
+        # curvature terms
+        self.calc_curvature()
+
+    def checkJacobian(self):
+        """
+        Check that the Jacobian J is consistent with 1/sqrt(det(g)) calculated from the
+        contravariant metric tensor. Raises ValueError (after plotting the difference)
+        if the relative error is larger than geometry_rtol anywhere.
+        """
+        # det(g) expanded along the first row, which needs fewer temporary arrays than
+        # g11*g22*g33 + 2*g12*g13*g23 - g11*g23**2 - g22*g13**2 - g33*g12**2
+        detg = (
+            self.g11 * (self.g22 * self.g33 - self.g23 * self.g23)
+            + self.g12 * (self.g13 * self.g23 - self.g12 * self.g33)
+            + self.g13 * (self.g12 * self.g23 - self.g22 * self.g13)
         )
+        Jcheck = self.bpsign / numpy.sqrt(detg)
         # ignore grid points at X-points as J should diverge there (as Bp->0)
         if Jcheck._corners_array is not None:
             # If Jcheck was not calculated at the corners location, no check is needed.
@@ -1150,83 +1163,26 @@ class MeshRegion:
             < self.user_options.geometry_rtol
         )
 
-        def ploterror(location):
-            if location == "centre":
-                thisJ = self.J.centre
-                this_one_over_sqrt_g = Jcheck.centre
-            elif location == "ylow":
-                thisJ = self.J.ylow
-                this_one_over_sqrt_g = Jcheck.ylow
-            elif location == "xlow":
-                thisJ = self.J.xlow
-                this_one_over_sqrt_g = Jcheck.xlow
-            elif location == "corners":
-                thisJ = self.J.corners
-                this_one_over_sqrt_g = Jcheck.corners
-            else:
-                raise ValueError("wrong location argument: " + str(location))
-            print(self.name, "rtol = " + str(self.user_options.geometry_rtol))
-            from matplotlib import pyplot
-
-            pyplot.figure(location)
-            pyplot.subplot(221)
-            pyplot.pcolor(thisJ)
-            pyplot.title("J")
-            pyplot.colorbar()
-            pyplot.subplot(222)
-            pyplot.pcolor(this_one_over_sqrt_g)
-            pyplot.title("1/sqrt(g)")
-            pyplot.colorbar()
-            pyplot.subplot(223)
-            pyplot.pcolor(thisJ - this_one_over_sqrt_g)
-            pyplot.title("abs difference")
-            pyplot.colorbar()
-            pyplot.subplot(224)
-            pyplot.pcolor((thisJ - this_one_over_sqrt_g) / thisJ)
-            pyplot.title("rel difference")
-            pyplot.colorbar()
-            pyplot.show()
-
-        if not numpy.all(check.centre):
-            ploterror("centre")
-            raise ValueError(
-                f"Geometry: Jacobian at centre should be consistent with "
-                f"1/sqrt(det(g)) calculated from the metric tensor. If the plot "
-                f"looks OK, you may want to increase the value of "
-                f"geometry_rtol={self.user_options.geometry_rtol}"
-            )
-
-        if not numpy.all(check.ylow):
-            ploterror("ylow")
-            raise ValueError(
-                f"Geometry: Jacobian at ylow should be consistent with "
-                f"1/sqrt(det(g)) calculated from the metric tensor. If the plot "
-                f"looks OK, you may want to increase the value of "
-                f"geometry_rtol={self.user_options.geometry_rtol}"
-            )
-
-        if check._xlow_array is not None:
-            if not numpy.all(check.xlow):
-                ploterror("xlow")
-                raise ValueError(
-                    f"Geometry: Jacobian at xlow should be consistent with "
-                    f"1/sqrt(det(g)) calculated from the metric tensor. If the "
-                    f"plot looks OK, you may want to increase the value of "
-                    f"geometry_rtol={self.user_options.geometry_rtol}"
+        for location in ["centre", "ylow", "xlow", "corners"]:
+            location_check = getattr(check, "_" + location + "_array")
+            if location_check is None:
+                # Jacobian not calculated at this location, so nothing to check
+                continue
+            if not numpy.all(location_check):
+                _plot_jacobian_error(
+                    self.name,
+                    self.user_options.geometry_rtol,
+                    getattr(self.J, location),
+                    getattr(Jcheck, location),
+                    location,
                 )
-        if check._corners_array is not None:
-            if not numpy.all(check.corners):
-                ploterror("corners")
                 raise ValueError(
-                    f"Geometry: Jacobian at corners should be consistent with "
-                    f"1/sqrt(det(g)) calculated from the metric tensor. If the "
-                    f"plot looks OK, you may want to increase the value of "
+                    f"Geometry: Jacobian at {location} should be consistent with "
+                    f"1/sqrt(det(g)) calculated from the metric tensor. If the plot "
+                    f"looks OK, you may want to increase the value of "
                     f"geometry_rtol={self.user_options.geometry_rtol}"
                 )
 
-        # curvature terms
-        self.calc_curvature()
-
     def calc_curvature(self):
         """
         Calculate curvature components. Note that curl_bOverB_x, curl_bOverB_y, and
@@ -1266,26 +1222,32 @@ class MeshRegion:
             # This calculates contravariant components of a curvature vector
 
             equilib = self.meshParent.equilibrium
-            psi = equilib.psi
-
-            def fpol(R, Z):
-                return equilib.fpol(psi(R, Z))
-
-            def fpolprime(R, Z):
-                return equilib.fpolprime(psi(R, Z))
-
+            R = self.Rxy
+            Z = self.Zxy
+
+            # Evaluate each equilibrium quantity once, and combine them using the same
+            # expressions as Equilibrium.Bzeta(), Equilibrium.B2(),
+            # Equilibrium.dB2dR(), etc. psi and Bzeta were already calculated in
+            # geometry1(), so reuse them.
+            fpolprime = equilib.fpolprime(self.psixy)
             # BR = dpsi/dZ / R
-            BR = equilib.Bp_R
+            BR = equilib.Bp_R(R, Z)
             # BZ = -dpsi/dR / R
-            BZ = equilib.Bp_Z
-            Bzeta = equilib.Bzeta
-            B2 = equilib.B2
-            dBzetadR = equilib.dBzetadR
-            dBzetadZ = equilib.dBzetadZ
-            dBRdZ = equilib.dBRdZ
-            dBZdR = equilib.dBZdR
-            dB2dR = equilib.dB2dR
-            dB2dZ = equilib.dB2dZ
+            BZ = equilib.Bp_Z(R, Z)
+            d2psidR2 = equilib.d2psidR2(R, Z)
+            d2psidZ2 = equilib.d2psidZ2(R, Z)
+            d2psidRdZ = equilib.d2psidRdZ(R, Z)
+
+            Bzeta = self.Btxy
+            B2 = BR**2 + BZ**2 + Bzeta**2
+            dBzetadR = -fpolprime * BZ - Bzeta / R
+            dBzetadZ = fpolprime * BR
+            dBRdR = (d2psidRdZ - BR) / R
+            dBRdZ = d2psidZ2 / R
+            dBZdR = -(d2psidR2 + BZ) / R
+            dBZdZ = -d2psidRdZ / R
+            dB2dR = 2.0 * (BR * dBRdR + BZ * dBZdR + Bzeta * dBzetadR)
+            dB2dZ = 2.0 * (BR * dBRdZ + BZ * dBZdZ + Bzeta * dBzetadZ)
 
             # In cylindrical coords
             # curl(A) = (1/R*d(AZ)/dzeta - d(Azeta)/dZ)  * Rhat
@@ -1308,25 +1270,15 @@ class MeshRegion:
             #                   = 1/B2*d(BR)/dZ - BR/B4*d(B2)/dZ
             #                     - 1/B2*d(BZ)/dR + BZ/B4*d(B2)/dR
             # remembering d/dzeta=0 for axisymmetric equilibrium
-            def curl_bOverB_Rhat(R, Z):
-                return -dBzetadZ(R, Z) / B2(R, Z) + Bzeta(R, Z) / B2(R, Z) ** 2 * dB2dZ(
-                    R, Z
-                )
+            # The common factor of 1/B2 is taken out of each component, to avoid
+            # calculating B2**2 and several separate divisions
+            Bzeta_over_B2 = Bzeta / B2
 
-            def curl_bOverB_Zhat(R, Z):
-                return (
-                    Bzeta(R, Z) / (R * B2(R, Z))
-                    + dBzetadR(R, Z) / B2(R, Z)
-                    - Bzeta(R, Z) / B2(R, Z) ** 2 * dB2dR(R, Z)
-                )
+            curl_bOverB_Rhat = (Bzeta_over_B2 * dB2dZ - dBzetadZ) / B2
 
-            def curl_bOverB_zetahat(R, Z):
-                return (
-                    dBRdZ(R, Z) / B2(R, Z)
-                    - BR(R, Z) / B2(R, Z) ** 2 * dB2dZ(R, Z)
-                    - dBZdR(R, Z) / B2(R, Z)
-                    + BZ(R, Z) / B2(R, Z) ** 2 * dB2dR(R, Z)
-                )
+            curl_bOverB_Zhat = (Bzeta / R + dBzetadR - Bzeta_over_B2 * dB2dR) / B2
+
+            curl_bOverB_zetahat = (dBRdZ - dBZdR - (BR * dB2dZ - BZ * dB2dR) / B2) / B2
 
             # We want to output contravariant components of Curl(b/B) in the
             # locally field-aligned coordinate system.
@@ -1344,34 +1296,29 @@ class MeshRegion:
             # dpsi/dZ = R*BR
             # => Grad(x) = (dpsi/dR, 0, dpsi/dZ).(Rhat, zetahat, Zhat)
             # => Grad(x) = (-R BZ, 0, R BR).(Rhat, zetahat, Zhat)
-            self.curl_bOverB_x = curl_bOverB_Rhat(self.Rxy, self.Zxy) * (
-                -self.Rxy * BZ(self.Rxy, self.Zxy)
-            ) + curl_bOverB_Zhat(self.Rxy, self.Zxy) * (
-                self.Rxy * BR(self.Rxy, self.Zxy)
+            self.curl_bOverB_x = curl_bOverB_Rhat * (-R * BZ) + curl_bOverB_Zhat * (
+                R * BR
             )
 
             if self.user_options.orthogonal:
                 # Grad(y) = (BR, 0, BZ)/(hy Bp)
-                self.curl_bOverB_y = (
-                    curl_bOverB_Rhat(self.Rxy, self.Zxy) * BR(self.Rxy, self.Zxy)
-                    + curl_bOverB_Zhat(self.Rxy, self.Zxy) * BZ(self.Rxy, self.Zxy)
-                ) / (self.Bpxy * self.hy)
+                self.curl_bOverB_y = (curl_bOverB_Rhat * BR + curl_bOverB_Zhat * BZ) / (
+                    self.Bpxy * self.hy
+                )
             else:
                 # Grad(y) = (d_Z, 0, -d_R)/(hy*cosBeta)
                 #         = (BR*cosBeta-BZ*sinBeta, 0, BZ*cosBeta+BR*sinBeta)
                 #           /(Bp*hy*cosBeta)
                 #         = (BR-BZ*tanBeta, 0, BZ+BR*tanBeta)/(Bp*hy)
                 self.curl_bOverB_y = (
-                    curl_bOverB_Rhat(self.Rxy, self.Zxy)
-                    * (BR(self.Rxy, self.Zxy) - BZ(self.Rxy, self.Zxy) * self.tanBeta)
-                    + curl_bOverB_Zhat(self.Rxy, self.Zxy)
-                    * (BZ(self.Rxy, self.Zxy) + BR(self.Rxy, self.Zxy) * self.tanBeta)
+                    curl_bOverB_Rhat * (BR - BZ * self.tanBeta)
+                    + curl_bOverB_Zhat * (BZ + BR * self.tanBeta)
                 ) / (self.Bpxy * self.hy)
 
             # Grad(z) = Grad(zeta) - Bt*hy/(Bp*R)*Grad(y) - I*Grad(x)
             # Grad(z) = (0, 1/R, 0) - Bt*hy/(Bp*R)*Grad(y) - I*Grad(x)
             self.curl_bOverB_z = (
-                curl_bOverB_zetahat(self.Rxy, self.Zxy) / self.Rxy
+                curl_bOverB_zetahat / R
                 - self.Btxy * self.hy / (self.Bpxy * self.Rxy) * self.curl_bOverB_y
                 - self.I * self.curl_bOverB_x
             )
@@ -1409,59 +1356,52 @@ class MeshRegion:
             warnings.warn("need to check that this is correct for non-orthogonal grids")
 
         hy = MultiLocationArray(self.nx, self.ny)
+
         # contours have accurately calculated distances
-        # calculate distances between j+/-0.5
-        for i in range(self.nx):
-            print(f"{self.name} calcHy {i} / {2 * self.nx + 1}", end="\r", flush=True)
-            d = numpy.array(
-                self.contours[2 * i + 1].get_distance(psi=self.equilibriumRegion.psi)
+        # All contours in a region have the same number of points, so the distances can
+        # be stacked into 2d arrays with shape (2 * nx + 1, number of points)
+        def get_distances(region, points=slice(None)):
+            return numpy.array(
+                [
+                    c.get_distance(psi=self.equilibriumRegion.psi)[points]
+                    for c in region.contours
+                ]
             )
-            hy.centre[i, :] = d[2::2] - d[:-2:2]
-            hy.ylow[i, 1:-1] = d[3:-1:2] - d[1:-3:2]
-            if self.connections["lower"] is not None:
-                cbelow = self.getNeighbour("lower").contours[2 * i + 1]
-                dbelow = cbelow.get_distance(psi=self.equilibriumRegion.psi)
-                hy.ylow[i, 0] = d[1] - d[0] + dbelow[-1] - dbelow[-2]
-            else:
-                # no region below, so estimate distance to point before '0' as the same
-                # as from '0' to '1'
-                hy.ylow[i, 0] = 2.0 * (d[1] - d[0])
-            if self.connections["upper"] is not None:
-                cabove = self.getNeighbour("upper").contours[2 * i + 1]
-                dabove = cabove.get_distance(psi=self.equilibriumRegion.psi)
-                hy.ylow[i, -1] = d[-1] - d[-2] + dabove[1] - dabove[0]
-            else:
-                # no region below, so estimate distance to point before '0' as the same
-                # as from '0' to '1'
-                hy.ylow[i, -1] = 2.0 * (d[-1] - d[-2])
 
-        for i in range(self.nx + 1):
-            print(
-                f"{self.name} calcHy {i + self.nx} / {2 * self.nx + 1}",
-                end="\r",
-                flush=True,
-            )
-            d = numpy.array(
-                self.contours[2 * i].get_distance(psi=self.equilibriumRegion.psi)
-            )
-            hy.xlow[i, :] = d[2::2] - d[:-2:2]
-            hy.corners[i, 1:-1] = d[3:-1:2] - d[1:-3:2]
-            if self.connections["lower"] is not None:
-                cbelow = self.getNeighbour("lower").contours[2 * i]
-                dbelow = cbelow.get_distance(psi=self.equilibriumRegion.psi)
-                hy.corners[i, 0] = d[1] - d[0] + dbelow[-1] - dbelow[-2]
+        distances = get_distances(self)
+        # Only the two points next to the boundary are needed from the neighbours
+        if self.connections["lower"] is not None:
+            distances_below = get_distances(self.getNeighbour("lower"), slice(-2, None))
+        else:
+            distances_below = None
+        if self.connections["upper"] is not None:
+            distances_above = get_distances(self.getNeighbour("upper"), slice(2))
+        else:
+            distances_above = None
+
+        # calculate distances between j+/-0.5
+        def set_hy(hy_y, hy_ylow, contour_slice):
+            d = distances[contour_slice]
+            hy_y[:, :] = d[:, 2::2] - d[:, :-2:2]
+            hy_ylow[:, 1:-1] = d[:, 3:-1:2] - d[:, 1:-3:2]
+            if distances_below is not None:
+                dbelow = distances_below[contour_slice]
+                hy_ylow[:, 0] = d[:, 1] - d[:, 0] + dbelow[:, -1] - dbelow[:, -2]
             else:
                 # no region below, so estimate distance to point before '0' as the same
                 # as from '0' to '1'
-                hy.corners[i, 0] = 2.0 * (d[1] - d[0])
-            if self.connections["upper"] is not None:
-                cabove = self.getNeighbour("upper").contours[2 * i]
-                dabove = cabove.get_distance(psi=self.equilibriumRegion.psi)
-                hy.corners[i, -1] = d[-1] - d[-2] + dabove[1] - dabove[0]
+                hy_ylow[:, 0] = 2.0 * (d[:, 1] - d[:, 0])
+            if distances_above is not None:
+                dabove = distances_above[contour_slice]
+                hy_ylow[:, -1] = d[:, -1] - d[:, -2] + dabove[:, 1] - dabove[:, 0]
             else:
-                # no region below, so estimate distance to point before '0' as the same
-                # as from '0' to '1'
-                hy.corners[i, -1] = 2.0 * (d[-1] - d[-2])
+                # no region above, so estimate distance to point after 'n' as the same
+                # as from 'n-1' to 'n'
+                hy_ylow[:, -1] = 2.0 * (d[:, -1] - d[:, -2])
+
+        # odd contours are at cell centres in x, even contours at cell faces
+        set_hy(hy.centre, hy.ylow, slice(1, None, 2))
+        set_hy(hy.xlow, hy.corners, slice(0, None, 2))
 
         hy /= self.dy
 
@@ -1489,12 +1429,6 @@ class MeshRegion:
                 f"hy.corners should always be positive. Negative values found in "
                 f"region '{self.name}' at (x,y) indices {negative_indices(hy.corners)}"
             )
-        if not numpy.all(hy.xlow > 0.0):
-            raise ValueError("hy.xlow should always be positive")
-        if not numpy.all(hy.ylow > 0.0):
-            raise ValueError("hy.ylow should always be positive")
-        if not numpy.all(hy.corners > 0.0):
-            raise ValueError("hy.corners should always be positive")
 
         return hy
 
@@ -1508,13 +1442,15 @@ class MeshRegion:
         self.sinBeta = MultiLocationArray(self.nx, self.ny)
         self.tanBeta = MultiLocationArray(self.nx, self.ny)
 
-        # for centre points
-        ###################
+        # Centre and ylow points are stacked along the y-direction, so that the
+        # equilibrium functions are only called once for both locations
 
-        # vector from i-1/2 to i+1/2
+        # vector from i-1/2 to i+1/2, using xlow points for centre and corners for ylow
         delta_x = [
-            self.Rxy.xlow[1:, :] - self.Rxy.xlow[:-1, :],
-            self.Zxy.xlow[1:, :] - self.Zxy.xlow[:-1, :],
+            numpy.concatenate(
+                [numpy.diff(f.xlow, axis=0), numpy.diff(f.corners, axis=0)], axis=1
+            )
+            for f in (self.Rxy, self.Zxy)
         ]
         # normalise to 1
         mod_delta_x = numpy.sqrt(delta_x[0] ** 2 + delta_x[1] ** 2)
@@ -1522,9 +1458,11 @@ class MeshRegion:
         delta_x[1] /= mod_delta_x
 
         # vector in the Grad(psi) direction
+        R = numpy.concatenate([self.Rxy.centre, self.Rxy.ylow], axis=1)
+        Z = numpy.concatenate([self.Zxy.centre, self.Zxy.ylow], axis=1)
         delta_psi = [
-            self.meshParent.equilibrium.f_R(self.Rxy.centre, self.Zxy.centre),
-            self.meshParent.equilibrium.f_Z(self.Rxy.centre, self.Zxy.centre),
+            self.meshParent.equilibrium.f_R(R, Z),
+            self.meshParent.equilibrium.f_Z(R, Z),
         ]
         # normalise to 1
         mod_delta_psi = numpy.sqrt(delta_psi[0] ** 2 + delta_psi[1] ** 2)
@@ -1532,45 +1470,18 @@ class MeshRegion:
         delta_psi[1] /= mod_delta_psi
 
         # cosBeta = delta_x.delta_psi
-        self.cosBeta.centre = delta_x[0] * delta_psi[0] + delta_x[1] * delta_psi[1]
+        cosBeta = delta_x[0] * delta_psi[0] + delta_x[1] * delta_psi[1]
 
         # Rotate delta_psi 90 degrees clockwise gives unit vector in e_y direction
         delta_y = [delta_psi[1], -delta_psi[0]]
 
         # sin(beta) = cos(pi/2 - beta) = e_x_hat.e_y_hat = delta_x.delta_y
-        self.sinBeta.centre = delta_x[0] * delta_y[0] + delta_x[1] * delta_y[1]
+        sinBeta = delta_x[0] * delta_y[0] + delta_x[1] * delta_y[1]
 
-        # for ylow points
-        #################
-
-        # vector from i-1/2 to i+1/2
-        delta_x = [
-            self.Rxy.corners[1:, :] - self.Rxy.corners[:-1, :],
-            self.Zxy.corners[1:, :] - self.Zxy.corners[:-1, :],
-        ]
-        # normalise to 1
-        mod_delta_x = numpy.sqrt(delta_x[0] ** 2 + delta_x[1] ** 2)
-        delta_x[0] /= mod_delta_x
-        delta_x[1] /= mod_delta_x
-
-        # unit vector in the Grad(psi) direction
-        delta_psi = [
-            self.meshParent.equilibrium.f_R(self.Rxy.ylow, self.Zxy.ylow),
-            self.meshParent.equilibrium.f_Z(self.Rxy.ylow, self.Zxy.ylow),
-        ]
-        # normalise to 1
-        mod_delta_psi = numpy.sqrt(delta_psi[0] ** 2 + delta_psi[1] ** 2)
-        delta_psi[0] /= mod_delta_psi
-        delta_psi[1] /= mod_delta_psi
-
-        # cosBeta = delta_x.delta_psi
-        self.cosBeta.ylow = delta_x[0] * delta_psi[0] + delta_x[1] * delta_psi[1]
-
-        # Rotate delta_psi 90 degrees clockwise gives unit vector in e_y direction
-        delta_y = [delta_psi[1], -delta_psi[0]]
-
-        # sin(beta) = cos(pi/2 - beta) = e_x.e_y = delta_x.delta_y
-        self.sinBeta.ylow = delta_x[0] * delta_y[0] + delta_x[1] * delta_y[1]
+        self.cosBeta.centre = cosBeta[:, : self.ny]
+        self.cosBeta.ylow = cosBeta[:, self.ny :]
+        self.sinBeta.centre = sinBeta[:, : self.ny]
+        self.sinBeta.ylow = sinBeta[:, self.ny :]
 
         self.tanBeta = self.sinBeta / self.cosBeta
 
@@ -1582,7 +1493,7 @@ class MeshRegion:
         # plane along a FineContour is ds*Bt/Bp.
         # The change in toroidal angle is therefore (ds Bt)/(R Bp).
         # The toroidal angle along the FineContour can be calculated by
-        # integrating using scipy.integrate.cumulative_trapezoid
+        # integrating with the trapezoid rule
 
         # Cannot just test 'connections['lower'] is not None' because periodic regions
         # always have a lower connection - requires us to give a yGroupIndex to each
@@ -1596,33 +1507,41 @@ class MeshRegion:
         region.zShift.ylow[:, :] = 0.0
         region.zShift.xlow[:, :] = 0.0
         region.zShift.corners[:, :] = 0.0
+        equilibrium = self.meshParent.equilibrium
+
+        def integrand_func(R, Z):
+            Bt = equilibrium.fpol(equilibrium.psi(R, Z)) / R
+            Bp = numpy.sqrt(equilibrium.Bp_R(R, Z) ** 2 + equilibrium.Bp_Z(R, Z) ** 2)
+            return Bt / (R * Bp)
+
         while True:
             print("calcZShift", region.name, end="\r", flush=True)
-            for i, contour in enumerate(region.contours):
-                fine_contour = contour.get_fine_contour(psi=self.equilibriumRegion.psi)
-                fine_distance = fine_contour.distance
-
-                def integrand_func(R, Z):
-                    Bt = (
-                        self.meshParent.equilibrium.fpol(
-                            self.meshParent.equilibrium.psi(R, Z)
-                        )
-                        / R
-                    )
-                    Bp = numpy.sqrt(
-                        self.meshParent.equilibrium.Bp_R(R, Z) ** 2
-                        + self.meshParent.equilibrium.Bp_Z(R, Z) ** 2
-                    )
-                    return Bt / (R * Bp)
+            fine_contours = [
+                contour.get_fine_contour(psi=self.equilibriumRegion.psi)
+                for contour in region.contours
+            ]
 
-                integrand = integrand_func(
-                    fine_contour.positions[:, 0],
-                    fine_contour.positions[:, 1],
-                )
+            # Evaluate the integrand on all the FineContours of the region at once, and
+            # integrate with a single cumulative sum. The trapezoid-rule increments
+            # between the end of one FineContour and the start of the next are set to
+            # zero, and the offset left over from the preceding FineContours is removed
+            # when zShift_fine is shifted to start at 'startInd' below.
+            contour_starts = numpy.cumsum(
+                [c.positions.shape[0] for c in fine_contours]
+            )[:-1]
+            positions = numpy.concatenate([c.positions for c in fine_contours])
+            integrand = integrand_func(positions[:, 0], positions[:, 1])
+            distance = numpy.concatenate([c.distance for c in fine_contours])
+            increments = numpy.diff(distance) * (integrand[1:] + integrand[:-1]) / 2.0
+            increments[contour_starts - 1] = 0.0
+            zShift_fines = numpy.split(
+                numpy.concatenate([[0.0], numpy.cumsum(increments)]), contour_starts
+            )
 
-                zShift_fine = cumulative_trapezoid(
-                    integrand, x=fine_distance, initial=0.0
-                )
+            for i, (contour, fine_contour, zShift_fine) in enumerate(
+                zip(region.contours, fine_contours, zShift_fines)
+            ):
+                fine_distance = fine_contour.distance
 
                 # Make sure zShift_fine starts at the 'startInd' of the
                 # contour/fine_contour
@@ -1804,21 +1723,31 @@ class MeshRegion:
         # e.g.  if 'foo' and 'bar' are two member variables, we could have
         # expr='#foo + #bar'
 
-        if region is None:
-            region_string = "self"
-        else:
-            region_string = "self.getNeighbour('" + region + "')"
-
-        if component is None:
-            component = ""
-        else:
-            component = "." + component
+        key = (expr, region, component)
+        f = self._expr_cache.get(key)
+        if f is None:
+            if region is None:
+                region_string = "self"
+            else:
+                region_string = "self.getNeighbour('" + region + "')"
 
-        # replace the name of the field with an expression to get that field from the
-        # MeshRegion 'region'
-        expr = re.sub("#(\\w+)", region_string + ".__dict__['\\1']" + component, expr)
+            if component is None:
+                component = ""
+            else:
+                component = "." + component
+
+            # replace the name of the field with an expression to get that field from
+            # the MeshRegion 'region', and compile into a function of the MeshRegion
+            # that is parsed only once for each expression
+            f = eval(
+                "lambda self: "
+                + re.sub(
+                    "#(\\w+)", region_string + ".__dict__['\\1']" + component, expr
+                )
+            )
+            self._expr_cache[key] = f
 
-        return eval(expr)
+        return f(self)
 
     def DDX(self, expr):
         # x-derivative of a MultiLocationArray, calculated with 2nd order central
@@ -1912,48 +1841,18 @@ class MeshRegion:
             )
 
         if f.centre is not None:
-            result.ylow[:, 1:-1] = (f.centre[:, 1:] - f.centre[:, :-1]) / self.dy.ylow[
-                :, 1:-1
-            ]
-            if self.connections["lower"] is not None:
-                f_lower = self._eval_from_region(expr, "lower", "centre[:, -1]")
-                result.ylow[:, 0] = (f.centre[:, 0] - f_lower) / self.dy.ylow[:, 0]
-            else:
-                result.ylow[:, 0] = (f.centre[:, 0] - f.ylow[:, 0]) / (
-                    self.dy.ylow[:, 0] / 2.0
-                )
-            if self.connections["upper"] is not None:
-                f_upper = self._eval_from_region(expr, "upper", "centre[:, 0]")
-                result.ylow[:, -1] = (f_upper - f.centre[:, -1]) / self.dy.ylow[:, -1]
-            else:
-                result.ylow[:, -1] = (f.ylow[:, -1] - f.centre[:, -1]) / (
-                    self.dy.ylow[:, -1] / 2.0
-                )
+            result.ylow = self._ddy_to_faces(
+                expr, f.centre, f.ylow, "centre", self.dy.ylow
+            )
         else:
             warnings.warn(
                 "No centre field available to calculate DDY(" + expr + ").ylow"
             )
 
         if f.xlow is not None:
-            result.corners[:, 1:-1] = (
-                f.xlow[:, 1:] - f.xlow[:, :-1]
-            ) / self.dy.corners[:, 1:-1]
-            if self.connections["lower"] is not None:
-                f_lower = self._eval_from_region(expr, "lower", "xlow[:, -1]")
-                result.corners[:, 0] = (f.xlow[:, 0] - f_lower) / self.dy.corners[:, 0]
-            else:
-                result.corners[:, 0] = (f.xlow[:, 0] - f.corners[:, 0]) / (
-                    self.dy.corners[:, 0] / 2.0
-                )
-            if self.connections["upper"] is not None:
-                f_upper = self._eval_from_region(expr, "upper", "xlow[:, 0]")
-                result.corners[:, -1] = (f_upper - f.xlow[:, -1]) / self.dy.corners[
-                    :, -1
-                ]
-            else:
-                result.corners[:, -1] = (f.corners[:, -1] - f.xlow[:, -1]) / (
-                    self.dy.corners[:, -1] / 2.0
-                )
+            result.corners = self._ddy_to_faces(
+                expr, f.xlow, f.corners, "xlow", self.dy.corners
+            )
         else:
             warnings.warn(
                 "No xlow field available to calculate DDY(" + expr + ").corners"
@@ -1961,6 +1860,28 @@ class MeshRegion:
 
         return result
 
+    def _ddy_to_faces(self, expr, f_cells, f_faces, location, dy):
+        # y-derivative at the y-faces (ylow or corners) of the cell values f_cells, which
+        # are at 'location'. The cell values are extended by the values from the
+        # neighbouring regions, or by the face values on the boundary where the spacing
+        # is dy/2, so that all the faces are calculated with a single difference.
+        dy = dy.copy()
+        if self.connections["lower"] is not None:
+            f_lower = self._eval_from_region(expr, "lower", location + "[:, -1]")
+        else:
+            f_lower = f_faces[:, 0]
+            dy[:, 0] /= 2.0
+        if self.connections["upper"] is not None:
+            f_upper = self._eval_from_region(expr, "upper", location + "[:, 0]")
+        else:
+            f_upper = f_faces[:, -1]
+            dy[:, -1] /= 2.0
+
+        f_extended = numpy.concatenate(
+            [f_lower[:, numpy.newaxis], f_cells, f_upper[:, numpy.newaxis]], axis=1
+        )
+        return numpy.diff(f_extended, axis=1) / dy
+
     def smoothnl_inner1(self, varname):
         f = getattr(self, varname)
         if self.connections["inner"] is not None:
@@ -2372,6 +2293,43 @@ class MeshRegion:
         setattr(self, varname, tmp)
 
 
+def _plot_jacobian_error(name, rtol, J, one_over_sqrt_g, location):
+    """
+    Plot the Jacobian J and 1/sqrt(det(g)) at one location of a MeshRegion, and their
+    difference, when they are not consistent
+    """
+    from matplotlib import pyplot
+
+    print(name, "rtol = " + str(rtol))
+
+    pyplot.figure(location)
+    pyplot.subplot(221)
+    pyplot.pcolor(J)
+    pyplot.title("J")
+    pyplot.colorbar()
+    pyplot.subplot(222)
+    pyplot.pcolor(one_over_sqrt_g)
+    pyplot.title("1/sqrt(g)")
+    pyplot.colorbar()
+    pyplot.subplot(223)
+    pyplot.pcolor(J - one_over_sqrt_g)
+    pyplot.title("abs difference")
+    pyplot.colorbar()
+    pyplot.subplot(224)
+    pyplot.pcolor((J - one_over_sqrt_g) / J)
+    pyplot.title("rel difference")
+    pyplot.colorbar()
+    pyplot.show()
+
+
+def _print_progress(i, n):
+    """
+    Check whether to print a progress message for iteration i of a loop with n
+    iterations, so that at most about 100 messages are printed for the loop
+    """
+    return i % max(1, n // 100) == 0
+
+
 def _calc_contour_distance(i, c, *, psi, **kwargs):
     print(
         f"Calculating contour distances: {i + 1}",
@@ -2439,8 +2397,12 @@ def _find_intersection(
             starti = len(contour) - 1
 
         # find whether one of the segments of the contour already intersects the
-        # wall
+        # wall, only checking segments that pass the vectorised pre-filter
+        may_intersect = equilibrium.segmentsMayIntersectWall(contour.as_ndarray())
+        coarse_lower_intersect = None
         for i in range(starti, 0, -1):
+            if not may_intersect[i - 1]:
+                continue
             coarse_lower_intersect = equilibrium.wallIntersection(
                 contour[i], contour[i - 1]
             )
@@ -2525,8 +2487,12 @@ def _find_intersection(
             starti = 0
 
         # find whether one of the segments of the contour already intersects the
-        # wall
+        # wall, only checking segments that pass the vectorised pre-filter
+        may_intersect = equilibrium.segmentsMayIntersectWall(contour.as_ndarray())
+        coarse_upper_intersect = None
         for i in range(starti, len(contour) - 1):
+            if not may_intersect[i]:
+                continue
             coarse_upper_intersect = equilibrium.wallIntersection(
                 contour[i], contour[i + 1]
             )
@@ -2658,6 +2624,77 @@ def regrid_contours(
     return contour
 
 
+def _git_diff_summary(path):
+    """
+    Summarise the uncommitted changes in the git repo at path, with the output of
+    'git diff --stat' and a SHA-256 hash of the output of 'git diff'. The output of
+    'git diff' is hashed as it is read, so it is never all held in memory.
+    """
+    stat = subprocess.run(
+        ["git", "diff", "--stat"], cwd=path, capture_output=True, text=True
+    )
+    if stat.returncode != 0:
+        raise RuntimeError(f"`git diff --stat` failed:\n{stat.stderr}")
+
+    sha256 = hashlib.sha256()
+    with subprocess.Popen(
+        ["git", "diff"], cwd=path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ) as process:
+        for chunk in iter(lambda: process.stdout.read(65536), b""):
+            sha256.update(chunk)
+    if process.returncode != 0:
+        raise RuntimeError("`git diff` failed")
+
+    return stat.stdout.strip() + "\nsha256 of git diff: " + sha256.hexdigest()
+
+
+@lru_cache(maxsize=2)
+def _get_version_info(full_git_diff=False):
+    """
+    Get the version of hypnotoad, the git hash, and a summary of the uncommitted
+    changes (see _git_diff_summary()) if there are any. If full_git_diff is True, the
+    output of git diff is also returned, otherwise None is returned in its place.
+    Finding these runs several git commands, so the result is cached. Python must be
+    restarted to pick up changes to the hypnotoad repo made during a session.
+    """
+    versions = get_versions()
+    git_diff = None
+    git_diff_summary = None
+
+    if versions["dirty"]:
+        # There are changes from the last commit, get git diff
+
+        from pathlib import Path
+        from hypnotoad.__init__ import __file__ as hypnotoad_init_file
+
+        hypnotoad_path = Path(hypnotoad_init_file).parent
+
+        git_diff_summary = _git_diff_summary(hypnotoad_path)
+
+        if full_git_diff:
+<<<<<<< HEAD
+            retval, git_diff = shell_safe(
+                "cd " + str(hypnotoad_path) + "&& git diff", pipe=True
+            )
+=======
+            try:
+                retval, git_diff = shell_safe(
+                    "cd " + str(hypnotoad_path) + "&& git diff", pipe=True
+                )
+            except RuntimeError as e:
+                raise RuntimeError(
+                    "`git diff` failed. It is recommended to do an editable install "
+                    "using `pip --user -e .` when developing. If you did a "
+                    "non-editable install, this error can occur if the repo was "
+                    "'dirty' when installed.\n\nThe error message was:\n" + str(e)
+                )
+
+>>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
+            git_diff = git_diff.strip()
+
+    return versions["version"], versions["full-revisionid"], git_diff, git_diff_summary
+
+
 class Mesh:
     """
 <<<<<<< HEAD
@@ -2686,6 +2723,16 @@ class Mesh:
             value_type=int,
             check_all=is_positive,
         ),
+        embed_full_git_diff=WithMeta(
+            False,
+            doc=(
+                "If hypnotoad has uncommitted changes, save the full output of "
+                "'git diff' in the grid file. By default only the output of "
+                "'git diff --stat' and a SHA-256 hash of the diff are saved, as the "
+                "full diff can be large for a repo with many changes."
+            ),
+            value_type=bool,
+        ),
     )
 
     def __init__(self, equilibrium, settings):
@@ -2714,38 +2761,12 @@ class Mesh:
         # Print the table of options
         print(self.user_options.as_table(), flush=True)
 
-        versions = get_versions()
-        self.version = versions["version"]
-        self.git_hash = versions["full-revisionid"]
-        self.git_diff = None
-
-        if versions["dirty"]:
-            # There are changes from the last commit, get git diff
-
-            from pathlib import Path
-            from hypnotoad.__init__ import __file__ as hypnotoad_init_file
-
-            hypnotoad_path = Path(hypnotoad_init_file).parent
-
-<<<<<<< HEAD
-            retval, self.git_diff = shell_safe(
-                "cd " + str(hypnotoad_path) + "&& git diff", pipe=True
-            )
-=======
-            try:
-                retval, self.git_diff = shell_safe(
-                    "cd " + str(hypnotoad_path) + "&& git diff", pipe=True
-                )
-            except RuntimeError as e:
-                raise RuntimeError(
-                    "`git diff` failed. It is recommended to do an editable install "
-                    "using `pip --user -e .` when developing. If you did a "
-                    "non-editable install, this error can occur if the repo was "
-                    "'dirty' when installed.\n\nThe error message was:\n" + str(e)
-                )
-
->>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-            self.git_diff = self.git_diff.strip()
+        (
+            self.version,
+            self.git_hash,
+            self.git_diff,
+            self.git_diff_summary,
+        ) = _get_version_info(self.user_options.embed_full_git_diff)
 
         # Generate MeshRegion object for each section of the mesh
         self.regions = {}
@@ -2799,40 +2820,47 @@ class Mesh:
 
         # create groups that connect in x
         self.x_groups = []
-        region_set = set(self.regions.values())
-        while region_set:
-            for region in region_set:
-                if region.connections["inner"] is None:
-                    break
+        # dicts are used as insertion-ordered sets, so that the groups are always
+        # constructed in the same order
+        pending = dict.fromkeys(self.regions.values())
+        # Start each group from a region with an inner boundary if there is one,
+        # otherwise the group is periodic and any region can be first
+        inner_roots = iter([r for r in pending if r.connections["inner"] is None])
+        while pending:
+            region = next(inner_roots, None)
+            if region is None:
+                region = next(iter(pending))
             group = []
+            group_set = set()
             while True:
                 group.append(region)
-                region_set.remove(region)
+                group_set.add(region)
+                del pending[region]
                 region = region.getNeighbour("outer")
-                if region is None or group.count(region) > 0:
+                if region is None or region in group_set:
                     # reached boundary or have all regions in a periodic group
                     break
             self.x_groups.append(group)
 
         # create groups that connect in y
         self.y_groups = []
-        region_list = list(self.regions.values())
-
-        # Once 'region_list' is empty, all regions have been added to some group
-        while region_list:
-            for i, first_region in enumerate(region_list):
-                if first_region.connections["lower"] is None:
-                    # Found a region with a lower boundary - start stepping through
-                    # y-connections from here
-                    break
-                # note, if no region with connections['lower']=None is found, then some
-                # arbitrary region will be 'first_region' after this loop. This is OK,
-                # as this region must be part of a periodic group, which we will handle.
+        pending = dict.fromkeys(self.regions.values())
+        # Start stepping through y-connections from regions with a lower boundary.
+        # Once these are used up, any remaining regions must be part of periodic
+        # groups, which can start from an arbitrary region.
+        lower_roots = iter([r for r in pending if r.connections["lower"] is None])
+
+        # Once 'pending' is empty, all regions have been added to some group
+        while pending:
+            first_region = next(lower_roots, None)
+            if first_region is None:
+                first_region = next(iter(pending))
 
             # Find all the regions connected in the y-direction to 'first_region' and
-            # add them to 'group'. Remove them from 'region_list' since each region can
+            # add them to 'group'. Remove them from 'pending' since each region can
             # only be in one group.
             group = []
+            group_set = set()
             next_region = first_region
             while True:
                 if next_region.yGroupIndex is not None:
@@ -2841,15 +2869,13 @@ class Mesh:
                     )
                 next_region.yGroupIndex = len(group)
                 group.append(next_region)
-                region_list.pop(i)
+                group_set.add(next_region)
+                del pending[next_region]
 
                 next_region = next_region.getNeighbour("upper")
-                if next_region is None or group.count(next_region) > 0:
+                if next_region is None or next_region in group_set:
                     # reached boundary or have all regions in a periodic group
                     break
-                # index of 'next_region' in 'region_list', so we can remove
-                # 'next_region' after adding to 'group' in the next step of the loop
-                i = region_list.index(next_region)
 
             self.y_groups.append(group)
 
@@ -2898,21 +2924,39 @@ class Mesh:
         for region in self.regions.values():
             print("Distances", region.name, flush=True)
             region.calcDistances()
-        for region in self.regions.values():
-            print("1", region.name, flush=True)
+        # Note: calcDistances() is not called with mapRegions() because it already uses
+        # self.parallel_map, which is not safe to call from several threads at once.
+        # geometry1() only modifies the region it is called on (or, in
+        # calcPoloidalDistance(), the regions in the y-group it starts), and
+        # geometry2() only reads the results of geometry1() from neighbouring regions.
+        # Both use the contour distances, which calcDistances() has now cached.
+
+        def geometry1(region):
+            print("1", region.name, end="\r", flush=True)
             region.geometry1()
-        for region in self.regions.values():
+
+        self.mapRegions(geometry1)
+
+        def geometry2(region):
             print("2", region.name, end="\r", flush=True)
             region.geometry2()
+
+        self.mapRegions(geometry2)
         print("Calculate zShift", flush=True)
-        for region in self.regions.values():
+
+        def calcZShift(region):
             print(region.name, end="\r", flush=True)
             region.calcZShift()
+
+        self.mapRegions(calcZShift)
         print("Calculate Metric", flush=True)
-        for region in self.regions.values():
+
+        def calcMetric(region):
             print(region.name, end="\r", flush=True)
             region.calcMetric()
 
+        self.mapRegions(calcMetric)
+
         if self.user_options.curvature_smoothing == "smoothnl":
             # Nonlinear smoothing. Tries to smooth only regions with large changes in
             # gradient.
@@ -2936,6 +2980,28 @@ class Mesh:
             self.smoothnl("curl_bOverB_y")
             self.smoothnl("curl_bOverB_z")
 
+    def mapRegions(self, function):
+        """
+        Call function on every region. If number_of_processors is greater than 1, the
+        calls are made from a pool of threads, so function must only modify the region
+        it is passed (or, like calcZShift() and calcPoloidalDistance(), regions that no
+        other call modifies). Exceptions raised by function are re-raised here.
+
+        The PsiContours are shared between regions, so any results that function gets
+        from them (e.g. get_distance() or get_fine_contour()) must already have been
+        cached before calling mapRegions(). For the geometry passes this is done by
+        calcDistances(), or by building the regions in the non-orthogonal case.
+        """
+        if self.user_options.number_of_processors > 1:
+            with ThreadPoolExecutor(
+                max_workers=self.user_options.number_of_processors
+            ) as executor:
+                # Consume the iterator to wait for all the calls and collect exceptions
+                list(executor.map(function, self.regions.values()))
+        else:
+            for region in self.regions.values():
+                function(region)
+
     def smoothnl(self, varname):
         """
         Smoothing algorithm copied from IDL hypnotoad
@@ -3592,7 +3658,8 @@ def followPerpendicular(
         if call_counter >= maxits:
             raise MaxIterException(maxits, psi)
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-        return (f_R(x[0], x[1]), f_Z(x[0], x[1]))
+        R, Z = x
+        return (f_R(R, Z), f_Z(R, Z))
 
     psirange = (psi0, psivals[-1])
     # make sure rounding errors do not cause exception:
@@ -3610,6 +3677,10 @@ def followPerpendicular(
         ):
             # rounding error present, reset psivals[0]
             psivals[0] = psirange[0]
+    # Note: solve_ivp only accepts a Python callable for the right-hand side (unlike,
+    # e.g., scipy.integrate.quad it does not accept a scipy.LowLevelCallable), and f_R
+    # and f_Z are general Python callables, so f cannot be replaced by a compiled
+    # callback.
     try:
         solution = solve_ivp(
             f,
@@ -3618,7 +3689,6 @@ def followPerpendicular(
             t_eval=psivals,
             rtol=rtol,
             atol=atol,
-            vectorized=True,
         )
 <<<<<<< HEAD
 =======
@@ -3735,13 +3805,11 @@ class BoutMesh(Mesh):
                 "all regions should have same set of x-grid sizes to be compatible "
                 "with a global, logically-rectangular grid"
             )
-        x_sizes = [0] + list(eq_region0.nx)
-
         # Note: x_startinds includes the end: self.x_startinds[-1] = nx
-        self.x_startinds = numpy.cumsum(x_sizes)
+        self.x_startinds = tuple(accumulate((0,) + tuple(eq_region0.nx)))
         x_regions = tuple(
-            slice(self.x_startinds[i], self.x_startinds[i + 1], None)
-            for i in range(len(self.x_startinds) - 1)
+            slice(start, end, None)
+            for start, end in zip(self.x_startinds[:-1], self.x_startinds[1:])
         )
         y_total = 0
         y_regions = {}
@@ -3788,6 +3856,64 @@ class BoutMesh(Mesh):
         # Call geometry() method of base class
         super().geometry()
 
+        # Names of the 2d fields other than Rxy and Zxy to collect from the regions, in
+        # the order they are written to the grid file
+        field_names = [
+            "psixy",
+            "dx",
+            "dy",
+            "poloidal_distance",
+            "Brxy",
+            "Bzxy",
+            "Bpxy",
+            "Btxy",
+            "Bxy",
+            "hy",
+            "dphidy",
+            "ShiftTorsion",
+            "zShift",
+        ]
+        # I think IntShiftTorsion should be the same as sinty in Hypnotoad1.
+        # IntShiftTorsion should never be used. It is only for some 'BOUT-06 style
+        # differencing'. IntShiftTorsion is not written by Hypnotoad1, so don't write
+        # here. /JTO 19/5/2019
+        if not self.user_options.shiftedmetric:
+            field_names.append("sinty")
+        field_names += ["g11", "g22", "g33", "g12", "g13", "g23", "J"]
+        field_names += ["g_11", "g_22", "g_33", "g_12", "g_13", "g_23"]
+        if self.user_options.curvature_type in (
+            "curl(b/B) with x-y derivatives",
+            "curl(b/B)",
+        ):
+            field_names += ["curl_bOverB_x", "curl_bOverB_y", "curl_bOverB_z"]
+        field_names += ["bxcvx", "bxcvy", "bxcvz"]
+        if hasattr(next(iter(self.equilibrium.regions.values())), "pressure"):
+            field_names.append("pressure")
+
+        # Allocate all the locations of all the 2d fields from a single zeroed buffer,
+        # rather than allocating each location of each field separately. Locations
+        # that are not set by any region would be written to the grid file as zeros
+        # anyway.
+        collected_names = ["Rxy", "Zxy"] + field_names
+        field_buffers = dict(
+            zip(
+                collected_names,
+                numpy.zeros(
+                    (
+                        len(collected_names),
+                        MultiLocationArray._packed_size(self.nx, self.ny),
+                    )
+                ),
+            )
+        )
+
+        # Look up the global indices of each region once, rather than for every field
+        regions_and_indices = [
+            (region, self.region_indices[region.myID])
+            for region in self.regions.values()
+        ]
+        first_region = regions_and_indices[0][0]
+
 <<<<<<< HEAD
         def addFromRegions(name):
 =======
@@ -3796,38 +3922,34 @@ class BoutMesh(Mesh):
             # Collect a 2d field from the regions
             self.fields_to_output.append(name)
             f = MultiLocationArray(self.nx, self.ny)
+            f._allocate_packed(lambda shape: field_buffers[name].reshape(shape))
             self.__dict__[name] = f
-            f.attributes = next(iter(self.regions.values())).__dict__[name].attributes
-            for region in self.regions.values():
+            f_first = first_region.__dict__[name]
+            f.attributes = f_first.attributes
+            for region, indices in regions_and_indices:
                 f_region = region.__dict__[name]
 
-                if f.attributes != f_region.attributes:
+                # The attributes were taken from the first region, so only need
+                # checking for the others
+                if f_region is not f_first and f.attributes != f_region.attributes:
                     raise ValueError(
                         "attributes of a field must be set consistently in every region"
                     )
                 if f_region._centre_array is not None:
-                    f.centre[self.region_indices[region.myID]] = f_region.centre
+                    f.centre[indices] = f_region.centre
                 if f_region._xlow_array is not None:
-                    f.xlow[self.region_indices[region.myID]] = f_region.xlow[:-1, :]
+                    f.xlow[indices] = f_region.xlow[:-1, :]
                 if f_region._ylow_array is not None:
-                    f.ylow[self.region_indices[region.myID]] = f_region.ylow[:, :-1]
+                    f.ylow[indices] = f_region.ylow[:, :-1]
                 if f_region._corners_array is not None:
-                    f.corners[self.region_indices[region.myID]] = f_region.corners[
-                        :-1, :-1
-                    ]
+                    f.corners[indices] = f_region.corners[:-1, :-1]
 <<<<<<< HEAD
 =======
                 if all_corners:
                     if f_region._corners_array is not None:
-                        f.lower_right_corners[self.region_indices[region.myID]] = (
-                            f_region.corners[1:, :-1]
-                        )
-                        f.upper_right_corners[self.region_indices[region.myID]] = (
-                            f_region.corners[1:, 1:]
-                        )
-                        f.upper_left_corners[self.region_indices[region.myID]] = (
-                            f_region.corners[:-1, 1:]
-                        )
+                        f.lower_right_corners[indices] = f_region.corners[1:, :-1]
+                        f.upper_right_corners[indices] = f_region.corners[1:, 1:]
+                        f.upper_left_corners[indices] = f_region.corners[:-1, 1:]
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
 
             # Set 'bout_type' so it gets saved in the grid file
@@ -3871,56 +3993,11 @@ class BoutMesh(Mesh):
         addFromRegions("Rxy", all_corners=True)
         addFromRegions("Zxy", all_corners=True)
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-        addFromRegions("psixy")
-        addFromRegions("dx")
-        addFromRegions("dy")
-        addFromRegions("poloidal_distance")
-        addFromRegionsXArray("total_poloidal_distance")
-        addFromRegions("Brxy")
-        addFromRegions("Bzxy")
-        addFromRegions("Bpxy")
-        addFromRegions("Btxy")
-        addFromRegions("Bxy")
-        addFromRegions("hy")
-        # if not self.user_options.orthogonal:
-        #    addFromRegions('beta')
-        #    addFromRegions('eta')
-        addFromRegions("dphidy")
-        addFromRegions("ShiftTorsion")
-        addFromRegions("zShift")
-        addFromRegionsXArray("ShiftAngle")
-        # I think IntShiftTorsion should be the same as sinty in Hypnotoad1.
-        # IntShiftTorsion should never be used. It is only for some 'BOUT-06 style
-        # differencing'. IntShiftTorsion is not written by Hypnotoad1, so don't write
-        # here. /JTO 19/5/2019
-        if not self.user_options.shiftedmetric:
-            addFromRegions("sinty")
-        addFromRegions("g11")
-        addFromRegions("g22")
-        addFromRegions("g33")
-        addFromRegions("g12")
-        addFromRegions("g13")
-        addFromRegions("g23")
-        addFromRegions("J")
-        addFromRegions("g_11")
-        addFromRegions("g_22")
-        addFromRegions("g_33")
-        addFromRegions("g_12")
-        addFromRegions("g_13")
-        addFromRegions("g_23")
-        if self.user_options.curvature_type in (
-            "curl(b/B) with x-y derivatives",
-            "curl(b/B)",
-        ):
-            addFromRegions("curl_bOverB_x")
-            addFromRegions("curl_bOverB_y")
-            addFromRegions("curl_bOverB_z")
-        addFromRegions("bxcvx")
-        addFromRegions("bxcvy")
-        addFromRegions("bxcvz")
+        for name in field_names:
+            addFromRegions(name)
 
-        if hasattr(next(iter(self.equilibrium.regions.values())), "pressure"):
-            addFromRegions("pressure")
+        for name in ["total_poloidal_distance", "ShiftAngle"]:
+            addFromRegionsXArray(name)
 
 <<<<<<< HEAD
 =======
@@ -4060,6 +4137,9 @@ class BoutMesh(Mesh):
             else:
                 raise ValueError("More than two separatrices not supported by BoutMesh")
 
+            # Global index of the end of each y-region (excluding boundary cells)
+            y_ends = tuple(accumulate(self.y_regions_noguards))
+
             if len(self.y_regions_noguards) == 1:
                 # No X-points
                 jyseps1_1 = -1
@@ -4071,17 +4151,17 @@ class BoutMesh(Mesh):
                 raise ValueError("Unrecognized topology with 2 y-regions")
             elif len(self.y_regions_noguards) == 3:
                 # single-null
-                jyseps1_1 = self.y_regions_noguards[0] - 1
+                jyseps1_1 = y_ends[0] - 1
                 jyseps2_1 = self.ny // 2
                 ny_inner = self.ny // 2
                 jyseps1_2 = self.ny // 2
-                jyseps2_2 = sum(self.y_regions_noguards[:2]) - 1
+                jyseps2_2 = y_ends[1] - 1
             elif len(self.y_regions_noguards) == 4:
                 # single X-point with all 4 legs ending on walls
-                jyseps1_1 = self.y_regions_noguards[0] - 1
+                jyseps1_1 = y_ends[0] - 1
                 jyseps2_1 = jyseps1_1
-                ny_inner = sum(self.y_regions_noguards[:2])
-                jyseps2_2 = sum(self.y_regions_noguards[:3]) - 1
+                ny_inner = y_ends[1]
+                jyseps2_2 = y_ends[2] - 1
                 jyseps1_2 = jyseps2_2
 
                 # for BoutMesh topology, this is equivalent to 2 X-points on top of each
@@ -4091,11 +4171,11 @@ class BoutMesh(Mesh):
                 raise ValueError("Unrecognized topology with 5 y-regions")
             elif len(self.y_regions_noguards) == 6:
                 # double-null
-                jyseps1_1 = self.y_regions_noguards[0] - 1
-                jyseps2_1 = sum(self.y_regions_noguards[:2]) - 1
-                ny_inner = sum(self.y_regions_noguards[:3])
-                jyseps1_2 = sum(self.y_regions_noguards[:4]) - 1
-                jyseps2_2 = sum(self.y_regions_noguards[:5]) - 1
+                jyseps1_1 = y_ends[0] - 1
+                jyseps2_1 = y_ends[1] - 1
+                ny_inner = y_ends[2]
+                jyseps1_2 = y_ends[3] - 1
+                jyseps2_2 = y_ends[4] - 1
 
                 if ixseps2 == self.nx:
                     # this is a connected-double-null configuration, with two
@@ -4186,18 +4266,33 @@ class BoutMesh(Mesh):
                 + self.user_options.as_table()
             )
             f.write("hypnotoad_inputs", inputs_string)
-            options_dict = dict(self.equilibrium.user_options)
-            options_dict.update(self.equilibrium.nonorthogonal_options)
-            options_dict.update(self.user_options)
-            f.write("hypnotoad_inputs_yaml", yaml.dump(options_dict))
+            #
+            # Any numpy types are converted to native Python types using their
+            # tolist() method (which returns a scalar for values that are not arrays),
+            # so that the YAML can be re-loaded with yaml.safe_load() rather than
+            # containing '!!python/object' tags.
+            options_dict = {}
+            for options in (
+                self.equilibrium.user_options,
+                self.equilibrium.nonorthogonal_options,
+                self.user_options,
+            ):
+                for key, value in options.items():
+                    options_dict[key] = getattr(value, "tolist", lambda: value)()
+            f.write("hypnotoad_inputs_yaml", yaml.safe_dump(options_dict))
 
             f.write_file_attribute("hypnotoad_version", self.version)
             if self.git_hash is not None:
                 f.write_file_attribute("hypnotoad_git_hash", self.git_hash)
                 f.write_file_attribute(
-                    "hypnotoad_git_diff",
-                    self.git_diff if self.git_diff is not None else "",
+                    "hypnotoad_git_diff_summary",
+                    self.git_diff_summary if self.git_diff_summary is not None else "",
                 )
+                if self.user_options.embed_full_git_diff:
+                    f.write_file_attribute(
+                        "hypnotoad_git_diff",
+                        self.git_diff if self.git_diff is not None else "",
+                    )
 
             if hasattr(self.equilibrium, "geqdsk_filename"):
                 # If grid was created from a geqdsk file, save the file name
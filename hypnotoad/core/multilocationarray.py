@@ -1,6 +1,38 @@
 import numbers
 import numpy
 
+# Alignment (in bytes) of the data of the arrays stored in MultiLocationArray, so that
+# numpy's vectorised inner loops can use aligned loads and stores
+_alignment = 64
+
+
+def _aligned_array(allocate, shape):
+    """
+    Create an array of floats with the given shape, whose data starts on a
+    _alignment-byte boundary. The buffer is created with allocate, which should be
+    numpy.empty or numpy.zeros.
+    """
+    itemsize = numpy.dtype(float).itemsize
+    nbytes = int(numpy.prod(shape)) * itemsize
+    buffer = allocate(nbytes + _alignment, dtype=numpy.uint8)
+    offset = -buffer.ctypes.data % _alignment
+    return buffer[offset : offset + nbytes].view(float).reshape(shape)
+
+
+def _aligned_empty(shape):
+    """
+    Create an uninitialised, aligned array of floats with the given shape
+    """
+    return _aligned_array(numpy.empty, shape)
+
+
+def _aligned_zeros(shape):
+    """
+    Create an aligned array of zeros with the given shape. numpy.zeros can get memory
+    that is already zeroed, so this avoids writing to every element.
+    """
+    return _aligned_array(numpy.zeros, shape)
+
 
 class MultiLocationArray(numpy.lib.mixins.NDArrayOperatorsMixin):
     """
@@ -22,6 +54,9 @@ class MultiLocationArray(numpy.lib.mixins.NDArrayOperatorsMixin):
     _xlow_array = None
     _ylow_array = None
     _corners_array = None
+    # Buffer holding all the locations handled by __array_ufunc__, when they were
+    # allocated together by _allocate_packed()
+    _packed = None
 <<<<<<< HEAD
 =======
     _lower_right_corners_array = None
@@ -35,91 +70,121 @@ class MultiLocationArray(numpy.lib.mixins.NDArrayOperatorsMixin):
         # Attributes that will be saved to output files along with the array
         self.attributes = {}
 
+    def __getstate__(self):
+        # The location arrays are pickled separately, so would no longer be views into
+        # the packed buffer after unpickling
+        state = self.__dict__.copy()
+        state.pop("_packed", None)
+        return state
+
+    @staticmethod
+    def _packed_size(nx, ny):
+        """
+        Number of elements in the buffer allocated by _allocate_packed()
+        """
+        return nx * ny + (nx + 1) * ny + nx * (ny + 1) + (nx + 1) * (ny + 1)
+
+    def _allocate_packed(self, allocate=_aligned_empty):
+        """
+        Allocate the arrays for all the locations handled by __array_ufunc__ as
+        consecutive views into a single buffer, so that operations between
+        MultiLocationArrays that are both stored this way need only one ufunc call.
+        Only the start of the buffer is aligned to _alignment bytes. The buffer is
+        created with allocate, which should be _aligned_empty or _aligned_zeros.
+        """
+        nx = self.nx
+        ny = self.ny
+        shapes = ((nx, ny), (nx + 1, ny), (nx, ny + 1), (nx + 1, ny + 1))
+        sizes = [n0 * n1 for n0, n1 in shapes]
+        self._packed = allocate([sum(sizes)])
+        start = 0
+        for (_, array_name), shape, size in zip(self._ufunc_locations, shapes, sizes):
+            setattr(self, array_name, self._packed[start : start + size].reshape(shape))
+            start += size
+
+    def _set_array(self, array_name, shape, value):
+        array = getattr(self, array_name)
+        if array is None:
+            # Every element is overwritten by value, so no need to initialise with
+            # zeros. Only store the new array once it is filled, in case value cannot be
+            # broadcast to shape.
+            array = _aligned_empty(shape)
+            array[...] = value
+            setattr(self, array_name, array)
+        else:
+            array[...] = value
+
     @property
     def centre(self):
         if self._centre_array is None:
-            self._centre_array = numpy.zeros([self.nx, self.ny])
+            self._centre_array = _aligned_zeros([self.nx, self.ny])
         return self._centre_array
 
     @centre.setter
     def centre(self, value):
-        if self._centre_array is None:
-            self._centre_array = numpy.zeros([self.nx, self.ny])
-        self._centre_array[...] = value
+        self._set_array("_centre_array", [self.nx, self.ny], value)
 
     @property
     def xlow(self):
         if self._xlow_array is None:
-            self._xlow_array = numpy.zeros([self.nx + 1, self.ny])
+            self._xlow_array = _aligned_zeros([self.nx + 1, self.ny])
         return self._xlow_array
 
     @xlow.setter
     def xlow(self, value):
-        if self._xlow_array is None:
-            self._xlow_array = numpy.zeros([self.nx + 1, self.ny])
-        self._xlow_array[...] = value
+        self._set_array("_xlow_array", [self.nx + 1, self.ny], value)
 
     @property
     def ylow(self):
         if self._ylow_array is None:
-            self._ylow_array = numpy.zeros([self.nx, self.ny + 1])
+            self._ylow_array = _aligned_zeros([self.nx, self.ny + 1])
         return self._ylow_array
 
     @ylow.setter
     def ylow(self, value):
-        if self._ylow_array is None:
-            self._ylow_array = numpy.zeros([self.nx, self.ny + 1])
-        self._ylow_array[...] = value
+        self._set_array("_ylow_array", [self.nx, self.ny + 1], value)
 
     @property
     def corners(self):
         if self._corners_array is None:
-            self._corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
+            self._corners_array = _aligned_zeros([self.nx + 1, self.ny + 1])
         return self._corners_array
 
     @corners.setter
     def corners(self, value):
-        if self._corners_array is None:
-            self._corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
-        self._corners_array[...] = value
+        self._set_array("_corners_array", [self.nx + 1, self.ny + 1], value)
 
 <<<<<<< HEAD
 =======
     @property
     def lower_right_corners(self):
         if self._lower_right_corners_array is None:
-            self._lower_right_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
+            self._lower_right_corners_array = _aligned_zeros([self.nx + 1, self.ny + 1])
         return self._lower_right_corners_array
 
     @lower_right_corners.setter
     def lower_right_corners(self, value):
-        if self._lower_right_corners_array is None:
-            self._lower_right_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
-        self._lower_right_corners_array[...] = value
+        self._set_array("_lower_right_corners_array", [self.nx + 1, self.ny + 1], value)
 
     @property
     def upper_right_corners(self):
         if self._upper_right_corners_array is None:
-            self._upper_right_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
+            self._upper_right_corners_array = _aligned_zeros([self.nx + 1, self.ny + 1])
         return self._upper_right_corners_array
 
     @upper_right_corners.setter
     def upper_right_corners(self, value):
-        if self._upper_right_corners_array is None:
-            self._upper_right_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
-        self._upper_right_corners_array[...] = value
+        self._set_array("_upper_right_corners_array", [self.nx + 1, self.ny + 1], value)
 
     @property
     def upper_left_corners(self):
         if self._upper_left_corners_array is None:
-            self._upper_left_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
+            self._upper_left_corners_array = _aligned_zeros([self.nx + 1, self.ny + 1])
         return self._upper_left_corners_array
 
     @upper_left_corners.setter
     def upper_left_corners(self, value):
-        if self._upper_left_corners_array is None:
-            self._upper_left_corners_array = numpy.zeros([self.nx + 1, self.ny + 1])
-        self._upper_left_corners_array[...] = value
+        self._set_array("_upper_left_corners_array", [self.nx + 1, self.ny + 1], value)
 
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
     def copy(self):
@@ -144,134 +209,149 @@ class MultiLocationArray(numpy.lib.mixins.NDArrayOperatorsMixin):
     # list, to support operations like np.add(array_like, list)
     _HANDLED_TYPES = (numpy.ndarray, numbers.Number)
 
+    # Cell locations handled by __array_ufunc__, as (property name, array attribute)
+    _ufunc_locations = (
+        ("centre", "_centre_array"),
+        ("xlow", "_xlow_array"),
+        ("ylow", "_ylow_array"),
+        ("corners", "_corners_array"),
+    )
+
     def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
         out = kwargs.get("out", ())
+        handled_types = self._HANDLED_TYPES + (MultiLocationArray,)
         for x in inputs + out:
             # Only support operations with instances of _HANDLED_TYPES.
             # Use MultiLocationArray instead of type(self) for isinstance to
             # allow subclasses that don't override __array_ufunc__ to
             # handle MultiLocationArray objects.
-            if not isinstance(x, self._HANDLED_TYPES + (MultiLocationArray,)):
+            if not isinstance(x, handled_types):
                 return NotImplemented
 
-        MLArrays = [self] + [x for x in inputs if isinstance(x, MultiLocationArray)]
+        is_MLArray_input = tuple(isinstance(x, MultiLocationArray) for x in inputs)
+        MLArrays = [x for x, is_MLA in zip(inputs, is_MLArray_input) if is_MLA]
+        if not any(x is self for x in MLArrays):
+            MLArrays.append(self)
+        ufunc_method = getattr(ufunc, method)
+
+        # Only locations that are set in all the MultiLocationArray arguments are
+        # calculated, so find them once before doing any work
+        active_locations = [
+            (location, array_name)
+            for location, array_name in self._ufunc_locations
+            if all(getattr(x, array_name) is not None for x in MLArrays)
+        ]
 
         result = MultiLocationArray(self.nx, self.ny)
 
-        # Defer to the implementation of the ufunc on unwrapped values.
-        if all(x._centre_array is not None for x in MLArrays):
-            this_inputs = tuple(
-                x._centre_array if isinstance(x, MultiLocationArray) else x
-                for x in inputs
-            )
-            if out:
-                kwargs["out"] = tuple(
-                    x.centre if isinstance(x, MultiLocationArray) else x for x in out
+        if (
+            method == "__call__"
+            and not kwargs
+            and len(active_locations) == len(self._ufunc_locations)
+            and self._is_float_loop(ufunc, inputs, MLArrays)
+        ):
+            # Write the result for every location straight into one packed buffer,
+            # rather than allocating a temporary for each location and copying it
+            result._allocate_packed()
+            if all(
+                x._packed is not None and (x.nx, x.ny) == (self.nx, self.ny)
+                for x in MLArrays
+            ) and all(
+                is_MLA or isinstance(x, numbers.Number)
+                for x, is_MLA in zip(inputs, is_MLArray_input)
+            ):
+                # All the locations are stored with the same layout, so a single call
+                # handles them all
+                ufunc(
+                    *(
+                        x._packed if is_MLA else x
+                        for x, is_MLA in zip(inputs, is_MLArray_input)
+                    ),
+                    out=result._packed,
                 )
-            this_result = getattr(ufunc, method)(*this_inputs, **kwargs)
-
-            if type(this_result) is tuple:
-                # multiple return values
-                if not type(result) is tuple:
-                    result = tuple(
-                        MultiLocationArray(self.nx, self.ny) for x in this_result
-                    )
-                for i, x in enumerate(this_result):
-                    result[i].centre = x
-
-            elif method == "at":
-                # no return value
-                result = None
             else:
-                # one return value
-                result.centre = this_result
-
-        # Defer to the implementation of the ufunc on unwrapped values.
-        if all(x._xlow_array is not None for x in MLArrays):
-            this_inputs = tuple(
-                x._xlow_array if isinstance(x, MultiLocationArray) else x
-                for x in inputs
-            )
-            if out:
-                kwargs["out"] = tuple(
-                    x.xlow if isinstance(x, MultiLocationArray) else x for x in out
-                )
-            this_result = getattr(ufunc, method)(*this_inputs, **kwargs)
-
-            if type(this_result) is tuple:
-                # multiple return values
-                if not type(result) is tuple:
-                    result = tuple(
-                        MultiLocationArray(self.nx, self.ny) for x in this_result
+                for _, array_name in active_locations:
+                    ufunc(
+                        *(
+                            getattr(x, array_name) if is_MLA else x
+                            for x, is_MLA in zip(inputs, is_MLArray_input)
+                        ),
+                        out=getattr(result, array_name),
                     )
-                for i, x in enumerate(this_result):
-                    result[i].xlow = x
+            return result
 
-            elif method == "at":
-                # no return value
-                result = None
-            else:
-                # one return value
-                result.xlow = this_result
-
-        # Defer to the implementation of the ufunc on unwrapped values.
-        if all(x._ylow_array is not None for x in MLArrays):
+        for location, array_name in active_locations:
+            # Defer to the implementation of the ufunc on unwrapped values.
             this_inputs = tuple(
-                x._ylow_array if isinstance(x, MultiLocationArray) else x
-                for x in inputs
+                getattr(x, array_name) if is_MLA else x
+                for x, is_MLA in zip(inputs, is_MLArray_input)
             )
             if out:
                 kwargs["out"] = tuple(
-                    x.ylow if isinstance(x, MultiLocationArray) else x for x in out
+                    getattr(x, location) if isinstance(x, MultiLocationArray) else x
+                    for x in out
                 )
-            this_result = getattr(ufunc, method)(*this_inputs, **kwargs)
+            this_result = ufunc_method(*this_inputs, **kwargs)
 
-            if type(this_result) is tuple:
-                # multiple return values
-                if not type(result) is tuple:
-                    result = tuple(
-                        MultiLocationArray(self.nx, self.ny) for x in this_result
-                    )
-                for i, x in enumerate(this_result):
-                    result[i].ylow = x
-
-            elif method == "at":
-                # no return value
-                result = None
-            else:
-                # one return value
-                result.ylow = this_result
-
-        # Defer to the implementation of the ufunc on unwrapped values.
-        if all(x._corners_array is not None for x in MLArrays):
-            this_inputs = tuple(
-                x._corners_array if isinstance(x, MultiLocationArray) else x
-                for x in inputs
-            )
             if out:
-                kwargs["out"] = tuple(
-                    x.corners if isinstance(x, MultiLocationArray) else x for x in out
-                )
-            this_result = getattr(ufunc, method)(*this_inputs, **kwargs)
-
-            if type(this_result) is tuple:
+                # The results were written into the arrays of out
+                continue
+            elif type(this_result) is tuple:
                 # multiple return values
-                if not type(result) is tuple:
+                if type(result) is not tuple:
                     result = tuple(
                         MultiLocationArray(self.nx, self.ny) for x in this_result
                     )
                 for i, x in enumerate(this_result):
-                    result[i].corners = x
+                    setattr(result[i], location, x)
 
             elif method == "at":
                 # no return value
                 result = None
             else:
                 # one return value
-                result.corners = this_result
+                setattr(result, location, this_result)
+
+        if out:
+            # Locations of the outputs that were not calculated are unset, as they would
+            # be in the result of the out-of-place operation, rather than keeping stale
+            # values
+            active_array_names = {array_name for _, array_name in active_locations}
+            for x in out:
+                if not isinstance(x, MultiLocationArray):
+                    continue
+                for _, array_name in self._ufunc_locations:
+                    if array_name not in active_array_names:
+                        setattr(x, array_name, None)
+                        # The remaining locations are no longer all in the buffer
+                        x._packed = None
+
+            # Like numpy, return the output argument(s), which were modified in-place,
+            # so that e.g. 'a += b' does not replace a with a copy
+            return out[0] if len(out) == 1 else out
 
         return result
 
+    @staticmethod
+    def _is_float_loop(ufunc, inputs, MLArrays):
+        """
+        Check if ufunc returns a single float array when called with inputs, so that
+        its result can be written into a float buffer allocated in advance
+        """
+        if ufunc.nout != 1 or "d" * ufunc.nin + "->d" not in ufunc.types:
+            return False
+        for x in inputs:
+            if isinstance(x, numpy.ndarray):
+                if x.dtype != float:
+                    return False
+            elif not isinstance(x, (numbers.Real, MultiLocationArray)):
+                return False
+        return all(
+            getattr(x, array_name).dtype == float
+            for x in MLArrays
+            for _, array_name in MultiLocationArray._ufunc_locations
+        )
+
     def zero(self):
         # Initialise all locations, set them to zero and return the result
 <<<<<<< HEAD
@@ -284,8 +364,34 @@ class MultiLocationArray(numpy.lib.mixins.NDArrayOperatorsMixin):
         # ``upper_left_corners`` are therefore not set to zero here as they do not need
         # to be initialized.
 >>>>>>> d8e6be6086b9c27aa1e1011713e10d829e5dc6d2
-        self.centre = 0.0
-        self.xlow = 0.0
-        self.ylow = 0.0
-        self.corners = 0.0
+        if all(getattr(self, name) is None for _, name in self._ufunc_locations):
+            # Allocate all the locations together in one zeroed buffer, as in fill()
+            self._allocate_packed(_aligned_zeros)
+            return self
+        self._zero_array("_centre_array", [self.nx, self.ny])
+        self._zero_array("_xlow_array", [self.nx + 1, self.ny])
+        self._zero_array("_ylow_array", [self.nx, self.ny + 1])
+        self._zero_array("_corners_array", [self.nx + 1, self.ny + 1])
+        return self
+
+    def _zero_array(self, array_name, shape):
+        array = getattr(self, array_name)
+        if array is None:
+            # Allocate directly as zeros, rather than allocating and then filling
+            setattr(self, array_name, _aligned_zeros(shape))
+        else:
+            array.fill(0.0)
+
+    def fill(self, value):
+        # Initialise all the locations handled by __array_ufunc__, set them to the
+        # scalar value and return the result
+        if all(getattr(self, name) is None for _, name in self._ufunc_locations):
+            # Allocate all the locations together, so they can be filled with a single
+            # call, and so that operations with other packed MultiLocationArrays need
+            # only one ufunc call
+            self._allocate_packed()
+            self._packed.fill(value)
+        else:
+            for location, _ in self._ufunc_locations:
+                setattr(self, location, value)
         return self
@@ -3,6 +3,7 @@ Utilities for writing and reading files compatible with Fortran
 
 """
 
+import mmap
 import re
 
 
@@ -113,7 +114,20 @@ def next_value(fh):
     Checks if the value is a float or int, returning
     the correct type depending on if '.' is in the string
 
+    If fh is an mmap.mmap, the rest of the buffer (from the current
+    position) is scanned directly, without copying it into lines.
+
     """
+    if isinstance(fh, mmap.mmap):
+        bytes_pattern = re.compile(rb"[ +\-]?\d+(?:\.\d+[Ee][\+\-]\d\d)?")
+        for match in bytes_pattern.finditer(fh, fh.tell()):
+            value = match.group()
+            if b"." in value:
+                yield float(value)
+            else:
+                yield int(value)
+        return
+
     pattern = re.compile(r"[ +\-]?\d+(?:\.\d+[Ee][\+\-]\d\d)?")
 
     # Go through each line, extract values, then yield them one by one
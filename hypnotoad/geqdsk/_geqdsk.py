@@ -174,6 +174,8 @@ def read(fh, cocos=1):
     Format is specified here:
     https://fusion.gat.com/theory/Efitgeqdsk
 
+    fh      - A text-mode file handle, or a read-only mmap.mmap of
+              the file, which is parsed without decoding it to text.
     cocos   - COordinate COnventions. Not fully handled yet,
               only whether psi is divided by 2pi or not.
               if < 10 then psi is divided by 2pi, otherwise not.
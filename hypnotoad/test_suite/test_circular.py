@@ -309,6 +309,36 @@ class TestCircular:
             atol=self.atol,
         )
 
+    def test_nonorthogonal_metric_locations(self):
+        """
+        Metric components of a non-orthogonal grid should only be set at the locations
+        where all the terms they are calculated from are set. In particular g33 and g_12
+        include terms that are only set at centre and ylow, so they have no xlow or
+        corners values, which are written to the grid file as zeros.
+        """
+        settings = self.test_settings.copy()
+        settings.update(
+            curvature_type="curl(b/B)",
+            orthogonal=False,
+            nonorthogonal_spacing_method="orthogonal",
+            nx=8,
+            ny=16,
+        )
+        mesh = self.get_mesh(settings)
+
+        for region in mesh.regions.values():
+            for name in ["g33", "g_12"]:
+                f = getattr(region, name)
+                assert f._centre_array is not None
+                assert f._ylow_array is not None
+                assert f._xlow_array is None
+                assert f._corners_array is None
+
+        for name in ["g33", "g_12"]:
+            f = getattr(mesh, name)
+            npt.assert_array_equal(f.xlow, 0.0)
+            npt.assert_array_equal(f.corners, 0.0)
+
     @pytest.mark.parametrize(
         "params",
         [
@@ -30,6 +30,7 @@ from hypnotoad.core.equilibrium import (
     Point2D,
     PsiContour,
 )
+from hypnotoad.core.multilocationarray import MultiLocationArray
 from .utils_for_tests import tight_approx
 
 PsiContour.user_options_factory = PsiContour.user_options_factory.add(
@@ -412,6 +413,12 @@ class TestContour:
         assert p.R == tight_approx(testcontour.R[5])
         assert p.Z == tight_approx(testcontour.Z[5])
 
+    def test_as_ndarray(self, testcontour):
+        positions = testcontour.c.as_ndarray()
+        assert positions.shape == (testcontour.npoints, 2)
+        assert positions[:, 0] == tight_approx(testcontour.R)
+        assert positions[:, 1] == tight_approx(testcontour.Z)
+
     def test_append(self, testcontour):
         c = testcontour.c
         point_to_add = c[-2]
@@ -769,6 +776,72 @@ class TestEquilibrium:
         assert intersect.R == tight_approx(1.0)
         assert intersect.Z == tight_approx(1.0)
 
+    def test_segmentsMayIntersectWall(self, eq):
+        positions = numpy.array(
+            [
+                [0.0, 0.0],
+                [0.5, 0.0],
+                [1.5, 0.0],  # crosses wall
+                [1.5, 2.0],  # outside wall
+                [0.5, 2.0],  # outside wall
+                [0.0, 1.0],  # ends on wall
+                [0.0, 1.0],  # zero-length segment
+                [0.5, 0.5],
+            ]
+        )
+        may_intersect = eq.segmentsMayIntersectWall(positions)
+        assert list(may_intersect) == [False, True, False, False, True, True, True]
+
+        # Must include every segment where wallIntersection() finds an intersection
+        for i in range(len(positions) - 1):
+            if not may_intersect[i]:
+                assert (
+                    eq.wallIntersection(
+                        Point2D(*positions[i]), Point2D(*positions[i + 1])
+                    )
+                    is None
+                )
+
+    def test_handleMultiLocationArray(self, eq):
+        calls = []
+
+        @Equilibrium.handleMultiLocationArray
+        def f(self, R, Z):
+            calls.append(numpy.shape(R))
+            return R**2 + Z
+
+        nx, ny = 3, 4
+        R = MultiLocationArray(nx, ny)
+        Z = MultiLocationArray(nx, ny)
+        R.centre = numpy.arange(nx * ny).reshape((nx, ny))
+        R.xlow = numpy.arange((nx + 1) * ny).reshape((nx + 1, ny)) + 0.5
+        R.ylow = numpy.arange(nx * (ny + 1)).reshape((nx, ny + 1)) + 0.25
+        R.corners = numpy.arange((nx + 1) * (ny + 1)).reshape((nx + 1, ny + 1))
+        Z.centre = 1.0
+        Z.xlow = 2.0
+        Z.ylow = 3.0
+        Z.corners = 4.0
+
+        result = f(eq, R, Z)
+
+        # all locations are evaluated with a single call
+        assert len(calls) == 1
+        assert result.centre == tight_approx(R.centre**2 + 1.0)
+        assert result.xlow == tight_approx(R.xlow**2 + 2.0)
+        assert result.ylow == tight_approx(R.ylow**2 + 3.0)
+        assert result.corners == tight_approx(R.corners**2 + 4.0)
+
+        @Equilibrium.handleMultiLocationArray
+        def g(self, R, Z):
+            return 1.5
+
+        result = g(eq, R, Z)
+        assert result.centre == tight_approx(numpy.full((nx, ny), 1.5))
+        assert result.corners == tight_approx(numpy.full((nx + 1, ny + 1), 1.5))
+
+        # non-MultiLocationArray arguments are passed straight through
+        assert f(eq, 2.0, 1.0) == tight_approx(5.0)
+
     @pytest.mark.parametrize(
         ["grad_lower", "lower", "upper"], [[0.2, 0.4, 2.0], [-0.2, 2.0, 0.4]]
     )
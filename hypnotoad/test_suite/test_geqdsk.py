@@ -1,3 +1,4 @@
+import mmap
 import numpy
 
 from io import StringIO
@@ -47,3 +48,43 @@ def test_writeread():
     # Check that data and data2 are the same
     for key in data:
         numpy.testing.assert_allclose(data2[key], data[key])
+
+
+def test_writeread_mmap(tmp_path):
+    """
+    Test that data can be written then read back from a memory-mapped file
+    """
+    nx = 17
+    ny = 13
+
+    data = {
+        "nx": nx,
+        "ny": ny,
+        "rdim": 2.0,
+        "zdim": 1.5,
+        "rcentr": 1.2,
+        "bcentr": 2.42,
+        "rleft": 0.5,
+        "zmid": 0.1,
+        "rmagx": 1.1,
+        "zmagx": 0.2,
+        "simagx": -2.3,
+        "sibdry": 0.21,
+        "cpasma": 1234521,
+        "fpol": numpy.random.rand(nx),
+        "pres": numpy.random.rand(nx),
+        "qpsi": numpy.random.rand(nx),
+        "psi": numpy.random.rand(nx, ny),
+    }
+
+    filename = tmp_path.joinpath("test.geqdsk")
+    with open(filename, "w") as fh:
+        _geqdsk.write(data, fh)
+
+    with open(filename, "rb") as fh, mmap.mmap(
+        fh.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        data2 = _geqdsk.read(mm)
+
+    for key in data:
+        numpy.testing.assert_allclose(data2[key], data[key])
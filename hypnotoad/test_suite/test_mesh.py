@@ -1,4 +1,5 @@
 import numpy
+import pickle
 import pytest
 from hypnotoad.core import mesh
 from .utils_for_tests import tight_approx
@@ -15,6 +16,9 @@ class TestMultiLocationArray:
 
     def test_zero(self, MLArray):
         a = MLArray.zero()
+        assert a is MLArray
+        assert a._packed is not None
+        assert a._packed.size == mesh.MultiLocationArray._packed_size(self.nx, self.ny)
 
         # don't use @property getters for the tests, as these will set the arrays to zero
         # when called, and we want to check that they are already zero.
@@ -22,3 +26,151 @@ class TestMultiLocationArray:
         assert a._xlow_array == tight_approx(numpy.zeros([self.nx + 1, self.ny]))
         assert a._ylow_array == tight_approx(numpy.zeros([self.nx, self.ny + 1]))
         assert a._corners_array == tight_approx(numpy.zeros([self.nx + 1, self.ny + 1]))
+
+        # Locations that were already set are zeroed in-place
+        a.centre[...] = 1.0
+        centre = a._centre_array
+        a.zero()
+        assert a._centre_array is centre
+        assert a._centre_array == tight_approx(numpy.zeros([self.nx, self.ny]))
+
+    def test_fill(self, MLArray):
+        a = MLArray.fill(2.0)
+        assert a is MLArray
+        assert a._packed is not None
+        assert a._centre_array == tight_approx(numpy.full([self.nx, self.ny], 2.0))
+        assert a._xlow_array == tight_approx(numpy.full([self.nx + 1, self.ny], 2.0))
+        assert a._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], 2.0))
+        assert a._corners_array == tight_approx(
+            numpy.full([self.nx + 1, self.ny + 1], 2.0)
+        )
+
+        # Locations are independent arrays that can be modified in-place
+        a.centre[0, 0] = 3.0
+        assert a.xlow[0, 0] == 2.0
+
+        b = mesh.MultiLocationArray(self.nx, self.ny)
+        b.centre = 1.0
+        b.fill(4.0)
+        assert b._centre_array == tight_approx(numpy.full([self.nx, self.ny], 4.0))
+        assert b._corners_array == tight_approx(
+            numpy.full([self.nx + 1, self.ny + 1], 4.0)
+        )
+
+    def test_ufunc(self, MLArray):
+        MLArray.centre = 1.0
+        MLArray.ylow = 2.0
+        other = mesh.MultiLocationArray(self.nx, self.ny)
+        other.centre = 3.0
+        other.xlow = 4.0
+        other.ylow = 5.0
+
+        a = 2.0 * MLArray + other
+
+        # Only locations set in both inputs are calculated
+        assert a._centre_array == tight_approx(numpy.full([self.nx, self.ny], 5.0))
+        assert a._xlow_array is None
+        assert a._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], 9.0))
+        assert a._corners_array is None
+
+        q, r = numpy.divmod(other, MLArray)
+        assert q._centre_array == tight_approx(numpy.full([self.nx, self.ny], 3.0))
+        assert r._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], 1.0))
+        assert q._xlow_array is None
+
+    def test_ufunc_out(self, MLArray):
+        MLArray.centre = 1.0
+        MLArray.ylow = 2.0
+        centre = MLArray.centre
+        other = mesh.MultiLocationArray(self.nx, self.ny)
+        other.centre = 3.0
+        other.ylow = 5.0
+
+        # In-place operations modify the existing arrays
+        a = MLArray
+        a += other
+        assert a is MLArray
+        assert a.centre is centre
+        assert a._centre_array == tight_approx(numpy.full([self.nx, self.ny], 4.0))
+        assert a._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], 7.0))
+
+        assert numpy.negative(other, out=other) is other
+        assert other._centre_array == tight_approx(numpy.full([self.nx, self.ny], -3.0))
+
+        # Locations of the output that are not set in all the inputs are unset, as in
+        # the result of the out-of-place operation
+        b = mesh.MultiLocationArray(self.nx, self.ny).fill(1.0)
+        b += other
+        assert b._packed is None
+        assert b._centre_array == tight_approx(numpy.full([self.nx, self.ny], -2.0))
+        assert b._xlow_array is None
+        assert b._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], -4.0))
+        assert b._corners_array is None
+        c = mesh.MultiLocationArray(self.nx, self.ny).fill(1.0) + other
+        assert c._xlow_array is None
+        assert c._corners_array is None
+
+    def test_ufunc_packed(self, MLArray):
+        MLArray.zero()
+        MLArray.centre = 1.0
+        MLArray.xlow = 2.0
+        MLArray.ylow = 3.0
+        MLArray.corners = 4.0
+
+        # Results with every location set are stored in one buffer
+        a = 2.0 * MLArray
+        assert a._packed is not None
+        assert numpy.shares_memory(a._corners_array, a._packed)
+
+        b = numpy.sqrt(a * a) - MLArray
+        assert b._centre_array == tight_approx(numpy.full([self.nx, self.ny], 1.0))
+        assert b._xlow_array == tight_approx(numpy.full([self.nx + 1, self.ny], 2.0))
+        assert b._ylow_array == tight_approx(numpy.full([self.nx, self.ny + 1], 3.0))
+        assert b._corners_array == tight_approx(
+            numpy.full([self.nx + 1, self.ny + 1], 4.0)
+        )
+
+        # In-place modification of a location is seen by later operations
+        b.xlow[0, 0] = 5.0
+        c = b + a
+        assert c.xlow[0, 0] == 9.0
+        assert c.xlow[1, 0] == 6.0
+
+        # Results of ufuncs without a float loop are not packed
+        assert (a > b)._packed is None
+
+        assert pickle.loads(pickle.dumps(c))._packed is None
+
+    def test_setter(self, MLArray):
+        MLArray.centre = numpy.arange(self.ny)
+        assert MLArray._centre_array == tight_approx(
+            numpy.broadcast_to(numpy.arange(self.ny), [self.nx, self.ny])
+        )
+        # Broadcast values are expanded into a full array, not stored as a read-only
+        # view, because the arrays are often modified in-place later
+        assert MLArray._centre_array.flags.writeable
+        MLArray.centre[0, 0] = -1.0
+        assert MLArray.centre[1, 0] == 0.0
+
+        # Failed assignment should not leave an uninitialised array behind
+        with pytest.raises(ValueError):
+            MLArray.xlow = numpy.zeros(self.ny + 3)
+        assert MLArray._xlow_array is None
+
+    def test_alignment(self, MLArray):
+        MLArray.centre = 1.0
+        for a in [MLArray._centre_array, MLArray.xlow]:
+            assert a.ctypes.data % 64 == 0
+            assert a.flags.c_contiguous
+
+    def test_contiguous(self, MLArray):
+        # Values are always copied into C-contiguous storage, so ufuncs acting on the
+        # stored arrays never see transposed strides
+        MLArray.centre = numpy.arange(self.nx * self.ny).reshape(self.ny, self.nx).T
+        MLArray.xlow = numpy.asfortranarray(numpy.ones([self.nx + 1, self.ny]))
+        assert MLArray._centre_array.flags.c_contiguous
+        assert MLArray._xlow_array.flags.c_contiguous
+
+        a = numpy.sqrt(MLArray)
+        assert a._centre_array.flags.c_contiguous
+        assert a._centre_array == tight_approx(numpy.sqrt(MLArray._centre_array))